@@ -1,10 +1,113 @@
 import google.generativeai as genai
+from config import ANALYSIS_BATCH_SIZE, ANALYSIS_BATCH_WAIT_MS, PROMPT_TOKEN_BUDGET, PROMPT_BATCH_TOKEN_BUDGET
+from analysis_cache import AnalysisCache, make_key
+from prompts import PromptTemplate, estimate_tokens, trim_history, trim_memory
+import asyncio
 import os
 import json
 import logging
+import time
+from metrics import LLM_REQUESTS, LLM_SECONDS, LLM_TOKENS
+from tracing import span, current, detach, linked_span
 
 logger = logging.getLogger(__name__)
 
+MODEL_NAME = 'gemini-3-flash-preview'
+ANALYSIS_FAILED = {"priority": 0, "summary": "Analysis failed", "action_required": False}
+SUMMARY_FAILED = "Failed to generate summary."
+
+class _PendingAnalysis:
+    __slots__ = ("message_text", "sender_info", "memory_text", "future", "trace")
+
+    def __init__(self, message_text, sender_info, memory_text, future):
+        self.message_text = message_text
+        self.sender_info = sender_info
+        self.memory_text = memory_text
+        self.future = future
+        self.trace = current() # The submitter's trace, which gets a linked span for the shared call
+
+class AnalysisBatcher:
+    """
+    Micro-batching front-end for Agent.analyze_message. Requests arriving within
+    `max_wait` seconds (or until `max_batch` are waiting) are sent as one structured-JSON
+    request with the shared memory block included once, and each caller gets its own result.
+    """
+
+    def __init__(self, agent, max_batch=ANALYSIS_BATCH_SIZE, max_wait=ANALYSIS_BATCH_WAIT_MS / 1000):
+        self.agent = agent
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = []
+        self._timer = None
+        self.stats = {"messages": 0, "requests": 0, "batched_requests": 0, "fallbacks": 0}
+
+    async def submit(self, message_text, sender_info, memory_text):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append(_PendingAnalysis(message_text, sender_info, memory_text, future))
+        self.stats["messages"] += 1
+
+        if len(self._queue) >= self.max_batch:
+            self._flush()
+        elif not self._timer:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._queue = self._queue, []
+        if batch:
+            asyncio.create_task(self._run(batch))
+
+    async def _run(self, batch):
+        # The task inherited one submitter's context; each member gets a linked span instead
+        detach()
+        # Only items sharing the same memory block can share a prompt (it is usually identical)
+        groups = {}
+        for item in batch:
+            groups.setdefault(item.memory_text, []).append(item)
+        await asyncio.gather(*(self._run_group(memory_text, items) for memory_text, items in groups.items()))
+
+    async def _run_group(self, memory_text, items):
+        try:
+            await self._analyze_group(memory_text, items)
+        except Exception as e:
+            logger.error(f"Batched analysis failed: {e}")
+        finally:
+            # Never leave a caller waiting
+            for item in items:
+                if not item.future.done():
+                    item.future.set_result(dict(ANALYSIS_FAILED))
+
+    async def _analyze_group(self, memory_text, items):
+        results = {}
+        if len(items) > 1:
+            self.stats["requests"] += 1
+            self.stats["batched_requests"] += 1
+            with linked_span([item.trace for item in items], "llm.analyze_batch", batch_size=len(items)) as attrs:
+                results = await self.agent._analyze_batch(
+                    [(item.message_text, item.sender_info) for item in items], memory_text
+                )
+                attrs["answered"] = len(results)
+
+        # Single items, and anything the batch answer missed, go through the one-message path
+        missing = [i for i in range(len(items)) if i not in results]
+        if len(items) > 1 and missing:
+            self.stats["fallbacks"] += len(missing)
+        self.stats["requests"] += len(missing)
+        singles = await asyncio.gather(*(self._analyze_one(items[i], memory_text, len(items) > 1) for i in missing))
+        results.update(zip(missing, singles))
+
+        for i, item in enumerate(items):
+            if not item.future.done():
+                item.future.set_result(results[i])
+
+    async def _analyze_one(self, item, memory_text, fallback):
+        with linked_span([item.trace], "llm.analyze", fallback=fallback):
+            return await self.agent._analyze_single(item.message_text, item.sender_info, memory_text)
+
 class Agent:
     def __init__(self):
         self.api_key = os.getenv("GENAI_KEY")
@@ -14,7 +117,8 @@ class Agent:
         
         genai.configure(api_key=self.api_key)
         try:
-            self.model = genai.GenerativeModel('gemini-3-flash-preview')
+            self.model_name = MODEL_NAME
+            self.model = genai.GenerativeModel(self.model_name)
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
             # Fallback to listing models to debug
@@ -22,32 +126,178 @@ class Agent:
                 logger.info(f"Available model: {m.name}")
             raise e
 
+        self.prompt = PromptTemplate("system_prompt.txt")
+        self.token_budget = PROMPT_TOKEN_BUDGET
+        self.batch_token_budget = PROMPT_BATCH_TOKEN_BUDGET
+        self.batcher = AnalysisBatcher(self)
+        self.cache = AnalysisCache()
+        self._inflight = {} # cache key -> future, so identical concurrent requests share one call
+
     async def analyze_message(self, message_text: str, sender_info: str, memory_text: str = "") -> dict:
         """
         Analyzes a message to determine importance and generate a summary.
         Returns a dictionary: { "priority": int (0-10), "summary": str, "action_required": bool }
+        Concurrent calls are micro-batched into shared requests (see AnalysisBatcher).
         """
         if not self.api_key:
             return {"priority": 0, "summary": "No API Key", "action_required": False}
 
-        # Load Prompt from File for easy management
+        with span("agent.analyze_message") as attrs:
+            return await self._analyze_message(message_text, sender_info, memory_text, attrs)
+
+    async def _analyze_message(self, message_text, sender_info, memory_text, attrs):
+        # Content-addressed cache: same inputs + model + template version => same answer
+        key = make_key(memory_text, message_text, sender_info, self.model_name, self.prompt.get_version(), self.token_budget)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            attrs["source"] = "cache"
+            return cached
+        if key in self._inflight:
+            attrs["source"] = "shared"
+            return dict(await asyncio.shield(self._inflight[key]))
+        attrs["source"] = "single" if self.batcher.max_batch <= 1 else "batch"
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
         try:
-            from jinja2 import Template
-            with open("system_prompt.txt", "r") as f:
-                template_str = f.read()
-                template = Template(template_str)
-                prompt = template.render(memory_text=memory_text, message_text=message_text)
-        except Exception as e:
-            logger.error(f"Failed to load system_prompt.txt: {e}")
+            if self.batcher.max_batch <= 1:
+                result = await self._analyze_single(message_text, sender_info, memory_text)
+            else:
+                result = await self.batcher.submit(message_text, sender_info, memory_text)
+            if result != ANALYSIS_FAILED:
+                self.cache.put(key, result)
+            future.set_result(result)
+            return result
+        except BaseException:
+            future.set_result(dict(ANALYSIS_FAILED)) # Waiters get the failure result; we re-raise
+            raise
+        finally:
+            del self._inflight[key]
+
+    def get_stats(self):
+        """Batching and cache counters for the dashboard."""
+        return {"batcher": self.batcher.stats, "cache": self.cache.get_stats()}
+
+    async def _generate(self, kind, prompt, **kwargs):
+        """One Gemini call, with latency, outcome and token usage recorded under `kind`."""
+        start = time.perf_counter()
+        with span(f"llm.{kind}") as attrs:
+            try:
+                response = await self.model.generate_content_async(prompt, **kwargs)
+            except Exception:
+                LLM_REQUESTS.inc(kind=kind, status="error")
+                raise
+            finally:
+                LLM_SECONDS.observe(time.perf_counter() - start, kind=kind)
+            LLM_REQUESTS.inc(kind=kind, status="ok")
+            usage = getattr(response, "usage_metadata", None)
+            if usage:
+                attrs["tokens_in"] = getattr(usage, "prompt_token_count", 0) or 0
+                attrs["tokens_out"] = getattr(usage, "candidates_token_count", 0) or 0
+                LLM_TOKENS.inc(attrs["tokens_in"], kind=kind, direction="in")
+                LLM_TOKENS.inc(attrs["tokens_out"], kind=kind, direction="out")
+            return response
+
+    def _render_prompt(self, memory_text, message_text):
+        """Renders the compiled system prompt, trimming memory and history to the token budget."""
+        memory_text, message_text = self.prompt.fit(memory_text, message_text, self.token_budget)
+        return self._render(memory_text, message_text)
+
+    def _render(self, memory_text, message_text, count=None):
+        """Renders the single-conversation prompt, or the batch variant for `count` conversations."""
+        if count is None:
+            prompt = self.prompt.render(memory_text=memory_text, message_text=message_text)
+        else:
+            prompt = self.prompt.render(memory_text=memory_text, message_text=message_text, batch=True, count=count)
+        if prompt is None:
             # Fallback (Generic)
-            prompt = f"Analyze this chat: {message_text}. Memory: {memory_text}. Json output."
+            if count is None:
+                prompt = f"Analyze this chat: {message_text}. Memory: {memory_text}. Json output."
+            else:
+                prompt = (f"Analyze each of these {count} conversations: {message_text}. Memory: {memory_text}. "
+                          f"Json array output, one object per conversation with its integer id.")
+        return prompt
+
+    async def _analyze_single(self, message_text, sender_info, memory_text):
+        prompt = self._render_prompt(memory_text, message_text)
         
         try:
-            response = await self.model.generate_content_async(prompt, generation_config={"response_mime_type": "application/json"})
+            response = await self._generate("analyze", prompt, generation_config={"response_mime_type": "application/json"})
             return json.loads(response.text)
         except Exception as e:
             logger.error(f"Error analyzing message: {e}")
-            return {"priority": 0, "summary": "Analysis failed", "action_required": False}
+            return dict(ANALYSIS_FAILED)
+
+    async def _analyze_batch(self, conversations, memory_text):
+        """
+        Analyzes several (message_text, sender_info) conversations in one request.
+        Returns {index: result}; indexes missing from the answer are left to the caller.
+        """
+        # One fixed cap for the whole request: the shared memory is sent once, no larger than in a
+        # single-message prompt (and at most 40% of the room), and the conversations split the rest evenly
+        room = max(0, self.batch_token_budget - self.prompt.overhead(batch=True))
+        single_room = max(0, self.token_budget - self.prompt.overhead())
+        memory_text = trim_memory(memory_text, min(single_room, room * 4 // 10))
+        share = (room - estimate_tokens(memory_text)) // len(conversations)
+
+        parts = []
+        for i, (text, sender) in enumerate(conversations):
+            header = f"=== Conversation {i} (sender: {sender}) ==="
+            parts.append(f"{header}\n{trim_history(text, min(share - estimate_tokens(header) - 1, single_room))}")
+        prompt = self._render(memory_text, "\n\n".join(parts), count=len(conversations))
+
+        try:
+            response = await self._generate("analyze_batch", prompt, generation_config={"response_mime_type": "application/json"})
+            answers = json.loads(response.text)
+            if not isinstance(answers, list):
+                # A single object can't be matched to a conversation: let every item fall back
+                raise ValueError(f"expected a JSON array, got {type(answers).__name__}")
+        except Exception as e:
+            logger.error(f"Error analyzing batch of {len(conversations)}: {e}")
+            return {}
+
+        results = {}
+        for answer in answers:
+            try:
+                index = int(answer.pop("id"))
+            except (AttributeError, KeyError, TypeError, ValueError):
+                continue
+            if 0 <= index < len(conversations):
+                results[index] = answer
+        return results
+
+    async def summarize_chunk(self, chat_name: str, points_text: str):
+        """
+        Summarizes one part of one chat's discussion (the map step of DiscussionSummarizer).
+        Results are cached by prompt, so a retried digest reuses finished parts. None on failure.
+        """
+        if not self.api_key:
+            return None
+
+        prompt = f"""
+        You are summarizing part of today's discussion in the Telegram group "{chat_name}".
+        Here are the raw discussion points (or earlier partial summaries):
+
+        {points_text}
+
+        Summarize this part in at most 8 short Markdown bullet points.
+        - Keep key topics, decisions, open questions and who raised them.
+        - Ignore trivial chatter.
+        - Output only the bullet points, without a heading.
+        """
+
+        key = make_key("discussion-chunk", self.model_name, prompt)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return cached
+        try:
+            response = await self._generate("summary_chunk", prompt)
+            summary = response.text.strip()
+        except Exception as e:
+            logger.error(f"Error summarizing part of {chat_name}: {e}")
+            return None
+        self.cache.put(key, summary)
+        return summary
 
     async def summarize_discussions(self, buffer_text: str) -> str:
         """
@@ -70,8 +320,8 @@ class Agent:
         """
         
         try:
-            response = await self.model.generate_content_async(prompt)
+            response = await self._generate("summary", prompt)
             return response.text
         except Exception as e:
             logger.error(f"Error generating summary: {e}")
-            return "Failed to generate summary."
+            return SUMMARY_FAILED
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from config import ANALYSIS_CACHE_MEMORY_ITEMS, ANALYSIS_CACHE_MAX_ENTRIES, ANALYSIS_CACHE_TTL
+from persistence import run_io, submit_io
+from metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CACHE_FILE = "analysis_cache.db"
+EVICT_EVERY = 100 # Writes between TTL/size sweeps of the disk store
+
+def make_key(*parts):
+    """Content address for a set of prompt inputs (order matters)."""
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+class AnalysisCache:
+    """
+    Two-level cache for LLM results: an in-memory LRU in front of a SQLite store.
+    Entries expire after `ttl` seconds; the disk store is trimmed to `max_entries`
+    (oldest first) and the memory level to `memory_items`. Memory hits are answered
+    inline; disk reads and writes run on the shared disk I/O thread.
+    """
+
+    def __init__(self, path=ANALYSIS_CACHE_FILE, memory_items=ANALYSIS_CACHE_MEMORY_ITEMS,
+                 max_entries=ANALYSIS_CACHE_MAX_ENTRIES, ttl=ANALYSIS_CACHE_TTL):
+        self.path = path
+        self.memory_items = memory_items
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory = OrderedDict() # key -> (created, value)
+        self._db = None
+        self._writes = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _conn(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False) # Used from the I/O thread
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, created REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS cache_created ON cache(created)")
+        return self._db
+
+    async def get(self, key):
+        """Returns the cached value or None."""
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry and now - entry[0] < self.ttl:
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            CACHE_LOOKUPS.inc(cache="analysis", result="memory_hit")
+            return json.loads(entry[1])
+
+        row = await run_io(self._disk_get, key)
+        if row and now - row[0] < self.ttl:
+            self._remember(key, row[0], row[1])
+            self.stats["disk_hits"] += 1
+            CACHE_LOOKUPS.inc(cache="analysis", result="disk_hit")
+            return json.loads(row[1])
+
+        self.stats["misses"] += 1
+        CACHE_LOOKUPS.inc(cache="analysis", result="miss")
+        return None
+
+    def _disk_get(self, key):
+        try:
+            return self._conn().execute("SELECT created, value FROM cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Analysis cache read failed: {e}")
+            return None
+
+    def put(self, key, value):
+        created = time.time()
+        raw = json.dumps(value, ensure_ascii=False)
+        self._remember(key, created, raw)
+        self.stats["stores"] += 1
+        submit_io(self._disk_put, key, created, raw)
+
+    def _disk_put(self, key, created, raw):
+        try:
+            db = self._conn()
+            with db:
+                db.execute("INSERT OR REPLACE INTO cache (key, created, value) VALUES (?, ?, ?)", (key, created, raw))
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self.evict()
+        except sqlite3.Error as e:
+            logger.error(f"Analysis cache write failed: {e}")
+
+    def _remember(self, key, created, raw):
+        self._memory[key] = (created, raw)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def evict(self):
+        """Drops expired entries, then the oldest ones beyond max_entries."""
+        db = self._conn()
+        with db:
+            removed = db.execute("DELETE FROM cache WHERE created < ?", (time.time() - self.ttl,)).rowcount
+            removed += db.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            ).rowcount
+        self.stats["evictions"] += removed
+
+    def get_stats(self):
+        lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        hits = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        }
@@ -0,0 +1,90 @@
+"""
+Benchmark: micro-batched Agent.analyze_message against a fake Gemini model.
+
+The fake model charges a fixed per-request latency plus a per-character cost and
+serves at most --model-concurrency requests at once (standing in for the API quota).
+Messages arrive every --interval-ms with the same memory block, as they do
+during a busy period.
+
+    python benchmarks/bench_agent_batching.py [--messages 200] [--batch-sizes 1,4,8,16]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # system_prompt.txt
+os.environ.setdefault("GENAI_KEY", "benchmark")
+
+from agent import Agent, AnalysisBatcher
+from analysis_cache import AnalysisCache
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeModel:
+    def __init__(self, latency, chars_per_second, concurrency):
+        self.latency = latency
+        self.chars_per_second = chars_per_second
+        self.slots = asyncio.Semaphore(concurrency)
+        self.requests = 0
+        self.prompt_chars = 0
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        async with self.slots:
+            self.requests += 1
+            self.prompt_chars += len(prompt)
+            await asyncio.sleep(self.latency + len(prompt) / self.chars_per_second)
+        ids = [int(i) for i in re.findall(r"=== Conversation (\d+) ", prompt)]
+        answer = {"priority": 2, "summary": "Follow up", "action_required": True, "deadline": None}
+        if not ids:
+            return FakeResponse(json.dumps(answer))
+        return FakeResponse(json.dumps([dict(answer, id=i) for i in ids]))
+
+async def run_one(batch_size, args, memory_text):
+    agent = Agent()
+    agent.model = FakeModel(args.latency_ms / 1000, args.chars_per_second, args.model_concurrency)
+    agent.batcher = AnalysisBatcher(agent, max_batch=batch_size, max_wait=args.wait_ms / 1000)
+    agent.cache = AnalysisCache(path=":memory:") # Measure the model path, not cache hits
+
+    latencies = []
+
+    async def one(i):
+        start = time.perf_counter()
+        result = await agent.analyze_message(f"Alice: message {i}\nBob: can you review PR {i}?", "Alice", memory_text)
+        assert result["summary"] == "Follow up"
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    pending = []
+    for i in range(args.messages):
+        pending.append(asyncio.create_task(one(i)))
+        await asyncio.sleep(args.interval_ms / 1000)
+    await asyncio.gather(*pending)
+    total = time.perf_counter() - start
+
+    print(f"batch={batch_size:3d} requests={agent.model.requests:4d} prompt_chars={agent.model.prompt_chars:9d} "
+          f"throughput={args.messages / total:6.1f} msg/s p50={statistics.median(latencies) * 1000:7.0f}ms "
+          f"max={max(latencies) * 1000:7.0f}ms")
+
+async def main(args):
+    memory_text = "Recent Finished Tasks:\n" + "\n".join(f"- Finished task number {i}" for i in range(40))
+    for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+        await run_one(batch_size, args, memory_text)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--interval-ms", type=float, default=10.0)
+    parser.add_argument("--batch-sizes", default="1,4,8,16")
+    parser.add_argument("--wait-ms", type=float, default=250.0)
+    parser.add_argument("--latency-ms", type=float, default=800.0)
+    parser.add_argument("--chars-per-second", type=float, default=50000.0)
+    parser.add_argument("--model-concurrency", type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
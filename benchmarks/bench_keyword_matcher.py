@@ -0,0 +1,100 @@
+"""
+Benchmark: per-update cost of keyword relevance filtering.
+
+Compares the old linear scan (lower-casing every keyword and testing it against the
+text and the caption) with the compiled KeywordMatcher, on a mix of short and long
+messages where most do not match, as in a busy group. The scan= and regex= columns
+time the matcher's two substring strategies on their own; SCAN_MAX_KEYWORDS is the
+crossover between them.
+
+    python benchmarks/bench_keyword_matcher.py [--keywords 4,8,...,200] [--messages 20000]
+
+Measured (CPython 3.11, 20000 messages, median of seeds 1-3 over two runs, per message):
+
+    keywords           4     8    12    16    24    32    48    64    80   200
+    scan us         2.13  3.69  4.01  5.02  7.43  9.52 13.48 17.43 21.08 47.99
+    regex us        2.74  3.74  3.28  4.53  5.12  6.07  7.21  6.92  7.54 12.31
+    word_boundary   6.53  7.64  7.30  7.60  8.05  8.98  8.76  8.50  9.27  9.96
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import keyword_matcher
+from keyword_matcher import KeywordMatcher
+
+class FakeMessage:
+    def __init__(self, text, caption=None):
+        self.text = text
+        self.caption = caption
+
+def linear_matches(message, keywords):
+    if message.text:
+        text = message.text.lower()
+        if any(k.lower() in text for k in keywords):
+            return True
+    if message.caption:
+        caption = message.caption.lower()
+        if any(k.lower() in caption for k in keywords):
+            return True
+    return False
+
+def random_word(rng):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+
+def make_messages(rng, count, keywords, hit_rate):
+    messages = []
+    for _ in range(count):
+        words = [random_word(rng) for _ in range(rng.choice((3, 8, 20, 60)))]
+        if rng.random() < hit_rate:
+            words.insert(rng.randrange(len(words)), rng.choice(keywords))
+        text = " ".join(words)
+        messages.append(FakeMessage(None, text) if rng.random() < 0.1 else FakeMessage(text))
+    return messages
+
+def timed(fn, messages):
+    start = time.perf_counter()
+    hits = sum(1 for m in messages if fn(m))
+    return (time.perf_counter() - start) / len(messages), hits
+
+def timed_strategy(matcher, messages, scan_max):
+    """Times matcher.matches with the scan/regex threshold forced to `scan_max`."""
+    default = keyword_matcher.SCAN_MAX_KEYWORDS
+    keyword_matcher.SCAN_MAX_KEYWORDS = scan_max
+    try:
+        return timed(matcher.matches, messages)
+    finally:
+        keyword_matcher.SCAN_MAX_KEYWORDS = default
+
+def main(args):
+    for seed in [int(s) for s in args.seeds.split(",")]:
+        rng = random.Random(seed)
+        for count in [int(k) for k in args.keywords.split(",")]:
+            keywords = list(dict.fromkeys(random_word(rng).capitalize() for _ in range(count)))
+            messages = make_messages(rng, args.messages, keywords, args.hit_rate)
+            matcher = KeywordMatcher(keywords, word_boundary=False)
+            bounded = KeywordMatcher(keywords, word_boundary=True)
+
+            linear, linear_hits = timed(lambda m: linear_matches(m, keywords), messages)
+            compiled, compiled_hits = timed(matcher.matches, messages)
+            scan, scan_hits = timed_strategy(matcher, messages, len(keywords))
+            regex, regex_hits = timed_strategy(matcher, messages, 0)
+            words, _ = timed(bounded.matches, messages)
+            assert linear_hits == compiled_hits == scan_hits == regex_hits
+
+            print(f"seed={seed} keywords={len(keywords):4d} linear={linear * 1e6:7.2f}us compiled={compiled * 1e6:6.2f}us "
+                  f"scan={scan * 1e6:6.2f}us regex={regex * 1e6:6.2f}us word_boundary={words * 1e6:6.2f}us "
+                  f"speedup={linear / compiled:5.1f}x hits={compiled_hits}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--keywords", default="4,8,12,16,24,32,48,64,80,200")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--hit-rate", type=float, default=0.05)
+    parser.add_argument("--seeds", default="1,2,3")
+    main(parser.parse_args())
@@ -0,0 +1,111 @@
+"""
+Benchmark: paginated task fetch from a local fake Notion serving 10k pages.
+
+Compares a plain sequential cursor walk (request page, parse page, request next)
+with NotionSync.stream_tasks(), which prefetches the next result page while the
+current one is parsed and yields tasks as they arrive.
+
+    python benchmarks/bench_notion_stream.py [--pages 10000] [--latency-ms 80] [--work-us 20]
+
+--work-us simulates downstream per-task work (rendering, filtering) done by the
+caller; with streaming it overlaps the remaining page fetches.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from notion_sync import NotionSync
+
+DATABASE_ID = "00000000-0000-0000-0000-000000000000"
+
+def make_page(i):
+    return {
+        "id": f"page-{i}",
+        "parent": {"database_id": DATABASE_ID},
+        "last_edited_time": "2024-01-01T00:00:00.000Z",
+        "properties": {
+            "Name": {"title": [{"text": {"content": f"Task {i}"}}]},
+            "Status": {"status": {"name": "Active" if i % 3 else "Done"}},
+            "Priority": {"number": i % 4},
+            "Sender": {"rich_text": [{"text": {"content": f"Sender {i % 50}"}}]},
+            "Link": {"url": f"https://t.me/c/1/{i}"},
+            "AgentComments": {"rich_text": [{"text": {"content": f"[abc{i % 10}] 2024-01-01 00:00:00 User: note {i}"}}]},
+        },
+    }
+
+class FakeNotion:
+    """In-process stand-in for the Notion search endpoint with a fixed per-request latency."""
+
+    def __init__(self, total_pages, latency):
+        self.pages = [make_page(i) for i in range(total_pages)]
+        self.latency = latency
+        self.requests = 0
+
+    async def search(self, **kwargs):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        start = int(kwargs.get("start_cursor") or 0)
+        end = start + kwargs.get("page_size", 100)
+        has_more = end < len(self.pages)
+        return {
+            "results": self.pages[start:end],
+            "has_more": has_more,
+            "next_cursor": str(end) if has_more else None,
+        }
+
+def make_sync(fake):
+    sync = NotionSync()
+    sync.database_id = DATABASE_ID
+    sync.notion = fake
+    return sync
+
+def consume(task, work):
+    """Busy-waits to simulate the caller's per-task processing."""
+    deadline = time.perf_counter() + work
+    while time.perf_counter() < deadline:
+        pass
+
+async def sequential_walk(sync, work):
+    """Baseline: no prefetch; the caller sees nothing until the whole list is built."""
+    tasks, cursor = [], None
+    while True:
+        response = await sync._search_page(cursor)
+        for page in response["results"]:
+            task = sync._parse_task(page)
+            if task: tasks.append(task)
+        if not response.get("has_more"): break
+        cursor = response["next_cursor"]
+    first = time.perf_counter()
+    for task in tasks:
+        consume(task, work)
+    return tasks, first
+
+async def streamed(sync, work):
+    tasks, first = [], None
+    async for task in sync.stream_tasks():
+        if first is None: first = time.perf_counter()
+        consume(task, work)
+        tasks.append(task)
+    return tasks, first
+
+async def run(pages, latency, work):
+    for name, fn in (("sequential cursor walk", sequential_walk), ("stream_tasks (prefetch)", streamed)):
+        fake = FakeNotion(pages, latency)
+        sync = make_sync(fake)
+        start = time.perf_counter()
+        tasks, first = await fn(sync, work)
+        total = time.perf_counter() - start
+        print(f"{name:26s} tasks={len(tasks):6d} requests={fake.requests:4d} "
+              f"first_task={(first - start) * 1000:8.1f}ms total={total * 1000:9.1f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=10000)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--work-us", type=float, default=20.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.pages, args.latency_ms / 1000, args.work_us / 1e6))
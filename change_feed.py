@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from config import CHANGE_FEED_SIZE, SSE_HEARTBEAT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_MAX = 256 # Events buffered per live subscriber before it is told to reload
+
+class ChangeFeed:
+    """
+    Ordered feed of task and audit changes for the dashboard. Each event carries only
+    the changed record and a cursor ("<epoch>-<seq>"); the last `size` events are kept
+    so a client can catch up from its cursor after reconnecting. A cursor from an older
+    process or one that fell out of the window gets a `reset` instead (reload in full).
+    """
+
+    def __init__(self, size=CHANGE_FEED_SIZE):
+        self.epoch = format(int(time.time()), "x")
+        self._seq = 0
+        self._events = deque(maxlen=size)
+        self._subscribers = set()
+
+    @property
+    def cursor(self):
+        return f"{self.epoch}-{self._seq}"
+
+    def publish(self, kind, **payload):
+        """Records a change and pushes it to live subscribers."""
+        self._seq += 1
+        event = {"cursor": self.cursor, "seq": self._seq, "type": kind, **payload}
+        self._events.append(event)
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow consumer: drop its backlog and have it reload instead
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"cursor": self.cursor, "seq": self._seq, "type": "reset"})
+        return event
+
+    def since(self, cursor):
+        """Events after `cursor`, or None if it can't be resumed from (client must reload)."""
+        try:
+            epoch, seq = cursor.rsplit("-", 1)
+            seq = int(seq)
+        except (AttributeError, ValueError):
+            return None
+        if epoch != self.epoch or seq > self._seq:
+            return None
+        oldest = self._events[0]["seq"] if self._events else self._seq + 1
+        if seq < oldest - 1:
+            return None # Older events already dropped from the window
+        return [e for e in self._events if e["seq"] > seq]
+
+    async def subscribe(self, cursor=None, heartbeat=SSE_HEARTBEAT_SECONDS):
+        """
+        Yields events live, starting with a `hello` (current cursor) for new clients or
+        the missed events / a `reset` for a resuming one. Yields None after `heartbeat`
+        idle seconds so the caller can keep the connection alive.
+        """
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_MAX)
+        self._subscribers.add(queue)
+        try:
+            if cursor is None:
+                yield {"cursor": self.cursor, "seq": self._seq, "type": "hello"}
+            else:
+                missed = self.since(cursor)
+                if missed is None:
+                    yield {"cursor": self.cursor, "seq": self._seq, "type": "reset"}
+                else:
+                    for event in missed:
+                        yield event
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self._subscribers.discard(queue)
+
+    def stats(self):
+        return {"cursor": self.cursor, "buffered": len(self._events), "subscribers": len(self._subscribers)}
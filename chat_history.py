@@ -0,0 +1,91 @@
+from collections import OrderedDict, deque
+import logging
+from config import CHAT_HISTORY_SIZE, CHAT_HISTORY_MAX_CHATS
+
+logger = logging.getLogger(__name__)
+
+def compact_message(message):
+    """Reduces a Pyrogram message to the fields the analysis context needs."""
+    if message.from_user:
+        sender = message.from_user.first_name or "Unknown"
+    else:
+        sender = message.chat.title or "Unknown"
+    return {
+        "id": message.id,
+        "sender": sender,
+        "text": message.text or "[Media]",
+        "timestamp": int(message.date.timestamp()) if message.date else 0
+    }
+
+class _ChatBuffer:
+    __slots__ = ("messages", "complete")
+
+    def __init__(self, size):
+        self.messages = deque(maxlen=size)
+        # True once the buffer is known to hold the chat's latest messages without gaps
+        # (seeded from get_chat_history, or filled by enough live updates)
+        self.complete = False
+
+class ChatHistoryCache:
+    """
+    Bounded ring buffers of recent messages per chat, filled from the update stream,
+    so building analysis context does not cost a get_chat_history round trip.
+    Chats are evicted least-recently-active first beyond `max_chats`.
+    """
+
+    def __init__(self, per_chat=CHAT_HISTORY_SIZE, max_chats=CHAT_HISTORY_MAX_CHATS):
+        self.per_chat = per_chat
+        self.max_chats = max_chats
+        self._chats = OrderedDict() # chat_id -> _ChatBuffer
+        self.stats = {"hits": 0, "cold": 0, "evicted_chats": 0}
+
+    def _buffer(self, chat_id):
+        buf = self._chats.get(chat_id)
+        if buf is None:
+            buf = self._chats[chat_id] = _ChatBuffer(self.per_chat)
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+                self.stats["evicted_chats"] += 1
+        else:
+            self._chats.move_to_end(chat_id)
+        return buf
+
+    def record(self, message):
+        """Adds (or, for edits, updates) a live message."""
+        record = compact_message(message)
+        buf = self._buffer(message.chat.id)
+        for i, existing in enumerate(buf.messages):
+            if existing["id"] == record["id"]:
+                buf.messages[i] = record
+                return
+        if buf.messages and record["id"] < buf.messages[-1]["id"]:
+            return # Late/old update; the buffer only tracks the tail of the chat
+        buf.messages.append(record)
+        if len(buf.messages) == buf.messages.maxlen:
+            buf.complete = True
+
+    def seed(self, chat_id, records):
+        """Replaces a chat's buffer with history fetched from Telegram (oldest first)."""
+        buf = self._buffer(chat_id)
+        live = [r for r in buf.messages if not records or r["id"] > records[-1]["id"]]
+        buf.messages.clear()
+        buf.messages.extend(records + live)
+        buf.complete = True
+
+    def get(self, chat_id, limit, upto_id=None):
+        """
+        Returns up to `limit` records (oldest first) ending at `upto_id`, or None if the
+        chat is cold or that message is no longer in the buffer.
+        """
+        buf = self._chats.get(chat_id)
+        if buf:
+            records = list(buf.messages)
+            if upto_id is not None:
+                ids = [r["id"] for r in records]
+                records = records[:ids.index(upto_id) + 1] if upto_id in ids else None
+            # Live updates since startup are gap-free, so `limit` of them is enough context
+            if records is not None and (buf.complete or len(records) >= limit):
+                self.stats["hits"] += 1
+                return records[-limit:]
+        self.stats["cold"] += 1
+        return None
@@ -11,3 +11,69 @@ SESSION_STRING = os.getenv("SESSION_STRING")  # For persistent sessions in conta
 # Keyword Filter Configuration
 KEYWORD_FILTER_STR = os.getenv("KEYWORD_FILTER", "")
 KEYWORD_FILTER = [k.strip() for k in KEYWORD_FILTER_STR.split(",") if k.strip()]
+# Match keywords as whole words only (default: substring match)
+KEYWORD_WORD_BOUNDARY = os.getenv("KEYWORD_WORD_BOUNDARY", "false").lower() in ("1", "true", "yes")
+
+# Task Cache Configuration (seconds)
+TASK_CACHE_TTL = int(os.getenv("TASK_CACHE_TTL", "1800"))  # Full resync from Notion
+TASK_SYNC_INTERVAL = int(os.getenv("TASK_SYNC_INTERVAL", "30"))  # Incremental (delta) sync
+TASKS_RESPONSE_TTL = float(os.getenv("TASKS_RESPONSE_TTL", "2"))  # Reuse the serialized /api/tasks body
+COMMENT_REFRESH_SECONDS = int(os.getenv("COMMENT_REFRESH_SECONDS", "600"))  # Re-read a task's Notion comment blocks when opened after this
+
+# Dashboard change feed: events kept for reconnect catch-up, SSE keep-alive interval (seconds)
+CHANGE_FEED_SIZE = int(os.getenv("CHANGE_FEED_SIZE", "1000"))
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+# Diagnostics: per-message traces kept for /api/debug/traces (0 disables); profiling endpoints are opt-in
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+DEBUG_ENDPOINTS = os.getenv("DEBUG_ENDPOINTS", "false").lower() in ("1", "true", "yes")
+
+# Notion API Configuration
+NOTION_RATE_LIMIT = float(os.getenv("NOTION_RATE_LIMIT", "3"))  # Requests per second (Notion allows ~3)
+NOTION_MAX_RETRIES = int(os.getenv("NOTION_MAX_RETRIES", "5"))  # Retries on 429/5xx with exponential backoff
+NOTION_WRITE_WORKERS = int(os.getenv("NOTION_WRITE_WORKERS", "3"))  # Concurrent write-behind senders
+
+# LLM Analysis Batching (batch size 1 disables batching)
+ANALYSIS_BATCH_SIZE = int(os.getenv("ANALYSIS_BATCH_SIZE", "8"))
+ANALYSIS_BATCH_WAIT_MS = int(os.getenv("ANALYSIS_BATCH_WAIT_MS", "250"))
+
+# LLM Analysis Cache (memory LRU in front of analysis_cache.db)
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", str(7 * 24 * 3600)))  # Seconds
+ANALYSIS_CACHE_MEMORY_ITEMS = int(os.getenv("ANALYSIS_CACHE_MEMORY_ITEMS", "1000"))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "50000"))  # On-disk rows
+
+# Prompt size limit (approximate tokens); memory and chat history are trimmed to fit
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+PROMPT_BATCH_TOKEN_BUDGET = int(os.getenv("PROMPT_BATCH_TOKEN_BUDGET", "16000"))  # Whole batched request, shared by its conversations
+
+# Per-chat message ring buffers used as analysis context
+CHAT_HISTORY_SIZE = int(os.getenv("CHAT_HISTORY_SIZE", "20"))  # Messages kept per chat
+CHAT_HISTORY_MAX_CHATS = int(os.getenv("CHAT_HISTORY_MAX_CHATS", "2000"))  # LRU-evicted beyond this
+
+# Per-chat burst coalescing: wait for a quiet window, then analyze the burst once (0 disables)
+CHAT_DEBOUNCE_MS = int(os.getenv("CHAT_DEBOUNCE_MS", "1500"))
+CHAT_DEBOUNCE_MAX_WAIT_MS = int(os.getenv("CHAT_DEBOUNCE_MAX_WAIT_MS", "6000"))  # Cap from the first message of a burst
+CHAT_DEBOUNCE_BYPASS_SAVED = os.getenv("CHAT_DEBOUNCE_BYPASS_SAVED", "true").lower() in ("1", "true", "yes")  # Saved Messages skip the wait
+
+# Message handling worker pool (priority queue between the Telegram dispatcher and analysis)
+HANDLER_WORKERS = int(os.getenv("HANDLER_WORKERS", "4"))
+HANDLER_QUEUE_MAX = int(os.getenv("HANDLER_QUEUE_MAX", "200"))  # Beyond this the least urgent jobs are shed
+
+# Discussion digest (map-reduce): max tokens per chunk, concurrent chunk summaries, /summary progress edits (s)
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "6000"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+SUMMARY_PROGRESS_INTERVAL = float(os.getenv("SUMMARY_PROGRESS_INTERVAL", "3"))
+
+# Rolling per-chat summaries: fold a chat's new points after this many points or minutes (0 disables either)
+SUMMARY_ROLLUP_POINTS = int(os.getenv("SUMMARY_ROLLUP_POINTS", "50"))
+SUMMARY_ROLLUP_MINUTES = int(os.getenv("SUMMARY_ROLLUP_MINUTES", "60"))
+
+# Audit log retention (agent.db)
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "30"))
+AUDIT_MAX_ENTRIES = int(os.getenv("AUDIT_MAX_ENTRIES", "100000"))
+
+# Local persistence: inserts are batched for this long / this many rows before one commit
+STORAGE_BATCH_MS = int(os.getenv("STORAGE_BATCH_MS", "200"))
+STORAGE_BATCH_SIZE = int(os.getenv("STORAGE_BATCH_SIZE", "100"))
+# Log callbacks that block the event loop for longer than this (0 disables)
+LOOP_LAG_THRESHOLD_MS = int(os.getenv("LOOP_LAG_THRESHOLD_MS", "100"))
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import time
+from config import CHAT_DEBOUNCE_MS, CHAT_DEBOUNCE_MAX_WAIT_MS
+
+logger = logging.getLogger(__name__)
+
+class _Burst:
+    __slots__ = ("client", "messages", "first_seen", "timer")
+
+    def __init__(self, client, first_seen):
+        self.client = client
+        self.messages = []
+        self.first_seen = first_seen
+        self.timer = None
+
+class ChatDebouncer:
+    """
+    Coalesces bursts of triggers per chat. Each new message restarts a `quiet` timer;
+    once the chat has been quiet that long (or `max_wait` has passed since the first
+    message of the burst) the handler runs once as
+    `handler(client, last_message, messages, received_at=...)`, where `received_at` is the
+    time.monotonic() at which the burst's first message arrived. A quiet window of 0
+    disables debouncing.
+    """
+
+    def __init__(self, handler, quiet=CHAT_DEBOUNCE_MS / 1000, max_wait=CHAT_DEBOUNCE_MAX_WAIT_MS / 1000):
+        self.handler = handler
+        self.quiet = quiet
+        self.max_wait = max(max_wait, quiet)
+        self._bursts = {} # chat_id -> _Burst
+        self._running = set()
+        self.stats = {"messages": 0, "bursts": 0, "coalesced": 0}
+
+    def submit(self, client, message, received_at=None):
+        """Adds a trigger (received at monotonic `received_at`, default now) to its chat's burst and (re)arms the flush timer."""
+        self.stats["messages"] += 1
+        if received_at is None: received_at = time.monotonic()
+        if self.quiet <= 0:
+            self._spawn(client, [message], received_at)
+            return
+
+        chat_id = message.chat.id
+        burst = self._bursts.get(chat_id)
+        if burst is None:
+            burst = self._bursts[chat_id] = _Burst(client, received_at)
+        burst.messages.append(message)
+
+        if burst.timer:
+            burst.timer.cancel()
+        deadline = burst.first_seen + self.max_wait
+        delay = max(0.0, min(self.quiet, deadline - time.monotonic()))
+        burst.timer = asyncio.get_running_loop().call_later(delay, self._flush, chat_id)
+
+    def _flush(self, chat_id):
+        burst = self._bursts.pop(chat_id, None)
+        if burst:
+            self._spawn(burst.client, burst.messages, burst.first_seen)
+
+    def _spawn(self, client, messages, received_at):
+        self.stats["bursts"] += 1
+        self.stats["coalesced"] += len(messages) - 1
+        if len(messages) > 1:
+            logger.info(f"Coalesced {len(messages)} messages from chat {messages[-1].chat.id} into one analysis.")
+        task = asyncio.create_task(self._run(client, messages, received_at))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, client, messages, received_at):
+        try:
+            await self.handler(client, messages[-1], messages, received_at=received_at)
+        except Exception as e:
+            logger.error(f"Debounced handler failed for chat {messages[-1].chat.id}: {e}")
+
+    @property
+    def pending(self):
+        return sum(len(b.messages) for b in self._bursts.values())
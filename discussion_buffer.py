@@ -2,37 +2,74 @@ import json
 import os
 from datetime import datetime
 import logging
+from storage import Storage
 
 logger = logging.getLogger(__name__)
 
-ACTIVE_BUFFER_FILE = "discussions.json"
+# Files used before discussions moved into the SQLite store; imported once if present
+SEGMENT_FILE = "discussions.jsonl"
+LEGACY_BUFFER_FILE = "discussions.json"
 HISTORY_FILE = "daily_history.json"
 
 class DiscussionBuffer:
-    def __init__(self):
-        self.buffer = self._load_buffer()
-        self._ensure_history_file()
+    """
+    Today's group discussion points, kept in the shared SQLite store: adding a point
+    buffers one insert for the next batched commit. Each chat may have a rolling summary
+    covering its points up to `upto_id`; only the points after it are still pending.
+    Reads run on the disk I/O thread.
+    """
 
-    def _load_buffer(self):
-        """Loads active buffer from disk."""
-        if os.path.exists(ACTIVE_BUFFER_FILE):
-            try:
-                with open(ACTIVE_BUFFER_FILE, "r") as f:
-                    return json.load(f)
-            except json.JSONDecodeError:
-                return []
-        return []
+    def __init__(self, storage=None):
+        self.storage = storage or Storage()
+        self.generation = 0 # Bumped by clear(), so in-flight rollups of an old buffer are discarded
+        self._migrate_files()
+
+    def _migrate_files(self):
+        """One-time import of the JSON/JSONL buffer and the JSON history file."""
+        points, rollups = [], {}
+        for path in (LEGACY_BUFFER_FILE, SEGMENT_FILE):
+            if not os.path.exists(path): continue
+            with open(path, "r") as f:
+                if path == LEGACY_BUFFER_FILE:
+                    try:
+                        records = json.load(f)
+                    except json.JSONDecodeError:
+                        records = []
+                else:
+                    records = []
+                    for line in f:
+                        try:
+                            records.append(json.loads(line))
+                        except ValueError:
+                            pass # Torn or corrupt line
+            for record in records:
+                if record.get("type") == "rollup":
+                    rollups[record["chat"]] = record
+                else:
+                    points.append(record)
 
-    def _save_buffer(self):
-        """Saves active buffer to disk."""
-        with open(ACTIVE_BUFFER_FILE, "w") as f:
-            json.dump(self.buffer, f, indent=2)
+        if points or rollups:
+            ids_by_chat = {}
+            for point in points:
+                ids_by_chat.setdefault(point["chat"], []).append(self.storage.add_discussion_point(point))
+            for chat, rollup in rollups.items():
+                ids = ids_by_chat.get(chat, [])
+                consumed = min(rollup["consumed"], len(ids))
+                self.storage.set_rollup(chat, rollup["summary"], ids[consumed - 1] if consumed else 0, rollup["timestamp"])
+            logger.info(f"Migrated {len(points)} discussion points to {self.storage.path}.")
+        for path in (LEGACY_BUFFER_FILE, SEGMENT_FILE):
+            if os.path.exists(path): os.remove(path)
 
-    def _ensure_history_file(self):
-        """Ensures history file exists."""
-        if not os.path.exists(HISTORY_FILE):
-            with open(HISTORY_FILE, "w") as f:
-                json.dump([], f)
+        if os.path.exists(HISTORY_FILE):
+            try:
+                with open(HISTORY_FILE, "r") as f:
+                    history = json.load(f)
+            except json.JSONDecodeError:
+                history = []
+            for entry in reversed(history): # File is newest first
+                self.storage.add_history(entry)
+            os.remove(HISTORY_FILE)
+            logger.info(f"Migrated {len(history)} archived digests to {self.storage.path}.")
 
     def add_point(self, chat_name: str, sender: str, summary: str):
         """Adds a discussion point to the buffer."""
@@ -42,62 +79,94 @@ class DiscussionBuffer:
             "sender": sender,
             "summary": summary
         }
-        self.buffer.append(point)
-        self._save_buffer()
+        self.storage.append_discussion_point(point)
         logger.info(f"Buffered discussion point from {sender} in {chat_name}")
 
-    def get_all(self):
-        """Returns all points in the active buffer."""
-        return self.buffer
+    async def get_all(self, upto_id=None):
+        """Returns all points in the active buffer (only those up to `upto_id`, if given)."""
+        return await self.storage.run(self.storage.discussion_points, upto_id=upto_id)
 
-    def get_grouped_text(self):
-        """Returns buffer content formatted for AI summarization."""
-        if not self.buffer:
-            return None
-            
-        text = "Here are the un-processed discussion points from today:\n\n"
+    async def last_point_id(self):
+        """Id of the newest committed point (0 if none): pass it to get_digest_input() and clear()."""
+        return await self.storage.run(self.storage.last_discussion_point_id)
+
+    async def get_rollups(self):
+        """{chat: {"summary", "upto_id", "timestamp"}}"""
+        return await self.storage.run(self.storage.get_rollups)
+
+    async def get_pending(self, rollups=None, upto_id=None):
+        """Returns {chat: (upto_id, [points not yet folded into the chat's rolling summary])}."""
+        rollups = rollups if rollups is not None else await self.get_rollups()
+        pending = {}
+        for point in await self.get_all(upto_id):
+            upto_id = rollups.get(point["chat"], {}).get("upto_id", 0)
+            if point["id"] > upto_id:
+                pending.setdefault(point["chat"], (upto_id, []))[1].append(point)
+        return pending
+
+    async def set_rollup(self, chat, summary, upto_id, generation):
+        """Records a chat's rolling summary covering its points up to `upto_id`."""
+        if generation != self.generation:
+            return False # Buffer was cleared while the summary was being made
+        await self.storage.run(self.storage.set_rollup, chat, summary, upto_id, datetime.now().isoformat())
+        return True
+
+    async def get_digest_input(self, upto_id=None):
+        """
+        Returns {chat: [lines]} for the digest: each chat's rolling summary (if any)
+        followed by the points it does not cover yet. With `upto_id`, later points are left
+        out, and so is a summary that already covers some of them (its chat's points are listed instead).
+        """
+        rollups = await self.get_rollups()
+        if upto_id is not None:
+            rollups = {chat: state for chat, state in rollups.items() if state["upto_id"] <= upto_id}
         grouped = {}
-        for p in self.buffer:
+        for chat, state in rollups.items():
+            grouped[chat] = [f"(Summary of earlier discussion)\n{state['summary']}"]
+        for chat, (_, points) in (await self.get_pending(rollups, upto_id)).items():
+            grouped.setdefault(chat, []).extend(f"- [{p['sender']}]: {p['summary']}" for p in points)
+        return grouped
+
+    async def get_grouped(self):
+        """Returns {chat: ["- [sender]: text", ...]} in arrival order."""
+        grouped = {}
+        for p in await self.get_all():
             chat = p['chat']
             if chat not in grouped: grouped[chat] = []
             grouped[chat].append(f"- [{p['sender']}]: {p['summary']}")
-            
+        return grouped
+
+    async def get_grouped_text(self):
+        """Returns buffer content formatted for AI summarization."""
+        grouped = await self.get_grouped()
+        if not grouped:
+            return None
+
+        text = "Here are the un-processed discussion points from today:\n\n"
         for chat, points in grouped.items():
             text += f"### {chat}\n" + "\n".join(points) + "\n\n"
-            
+
         return text
 
-    def clear(self):
-        """Clears the active buffer."""
-        self.buffer = []
-        self._save_buffer()
+    async def clear(self, upto_id):
+        """
+        Clears the points up to `upto_id` (the last one summarized) and the rolling summaries.
+        Points recorded while the digest was being made stay for the next one.
+        """
+        self.generation += 1
+        await self.storage.run(self.storage.clear_discussions, upto_id)
 
-    def archive_daily_summary(self, summary_text):
-        """Archives the generated summary to history."""
+    async def archive_daily_summary(self, summary_text, upto_id=None):
+        """Archives the generated summary (of the points up to `upto_id`) to history."""
         entry = {
             "date": datetime.now().strftime("%Y-%m-%d"),
             "timestamp": datetime.now().isoformat(),
             "summary_text": summary_text,
-            "point_count": len(self.buffer)
+            "point_count": await self.storage.run(self.storage.count_discussion_points, upto_id)
         }
-        
-        try:
-            with open(HISTORY_FILE, "r") as f:
-                history = json.load(f)
-        except:
-            history = []
-            
-        history.insert(0, entry) # Newest first
-        
-        with open(HISTORY_FILE, "w") as f:
-            json.dump(history, f, indent=2)
-            
+        await self.storage.run(self.storage.add_history, entry)
         logger.info("Archived daily discussion summary.")
 
-    def get_history(self):
-        """Returns historical summaries."""
-        try:
-            with open(HISTORY_FILE, "r") as f:
-                return json.load(f)
-        except:
-            return []
+    async def get_history(self, before_id=None, limit=None):
+        """Returns historical summaries (newest first), optionally one page older than `before_id`."""
+        return await self.storage.run(self.storage.get_history, before_id=before_id, limit=limit)
@@ -0,0 +1,132 @@
+import re
+import logging
+from collections import Counter
+from config import KEYWORD_WORD_BOUNDARY
+
+logger = logging.getLogger(__name__)
+
+# Below this many keywords a plain substring scan of the casefolded text is cheaper
+# than the compiled regex (see benchmarks/bench_keyword_matcher.py)
+SCAN_MAX_KEYWORDS = 8 # Even at 8 keywords, regex ~1.2x faster at 12 and ~2.5x at 64
+
+# English letters, most frequent first: breaks ties towards rarer anchor characters
+LETTER_FREQUENCY = "etaoinsrhldcumfpgwybvkxjqz"
+
+def _trie_pattern(node):
+    """
+    Regex for a character trie, factoring shared prefixes ("ab|ac" -> "a(?:b|c)") so the
+    engine tries one branch per character instead of every keyword at every position.
+    Longer continuations are tried before a keyword ending at this node.
+    """
+    branches = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items()) if ch]
+    if not branches:
+        return ""
+    if "" in node:
+        return "(?:" + "|".join(branches) + ")?"
+    if len(branches) == 1:
+        return branches[0]
+    return "(?:" + "|".join(branches) + ")"
+
+def _rarity(ch):
+    return LETTER_FREQUENCY.find(ch) # -1 (least rare) for characters outside the table
+
+def _choose_anchors(keywords):
+    """Maps each keyword to one of its characters, using as few distinct characters as possible (greedy set cover)."""
+    anchors, left = {}, set(keywords)
+    while left:
+        counts = Counter(ch for keyword in left for ch in set(keyword))
+        anchor = max(counts, key=lambda ch: (counts[ch], _rarity(ch), ch))
+        for keyword in [k for k in left if anchor in k]:
+            anchors[keyword] = anchor
+            left.discard(keyword)
+    return anchors
+
+def _suffix_pattern(node):
+    """
+    Like _trie_pattern, but a keyword ending at a node is confirmed by a lookbehind for
+    the whole keyword (the part before the anchor was never matched), unless it starts at its anchor.
+    """
+    branches = [re.escape(ch) + _suffix_pattern(child) for ch, child in sorted(node.items()) if ch]
+    ends = node.get("", ())
+    branches += [""] if "" in ends else [f"(?<={re.escape(keyword)})" for keyword in sorted(ends)]
+    return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+def _anchored_pattern(keywords):
+    """
+    Substring regex that starts every keyword at an anchor character (the rest of the keyword
+    is matched forward and its head checked by lookbehind). A trie alternation starts with up to
+    one branch per letter, which sre walks at every position of the text; here the pattern starts
+    with a few anchor literals, which sre turns into a charset prefix and skips over in C.
+    """
+    groups = {}
+    for keyword, anchor in _choose_anchors(keywords).items():
+        node = groups.setdefault(anchor, {})
+        start = keyword.index(anchor)
+        for ch in keyword[start + 1:]:
+            node = node.setdefault(ch, {})
+        node.setdefault("", []).append(keyword if start else "")
+    return "|".join(re.escape(anchor) + _suffix_pattern(node) for anchor, node in sorted(groups.items()))
+
+class KeywordMatcher:
+    """
+    Case-insensitive multi-keyword matcher. Keywords are casefolded and compiled into one
+    regex (rebuilt only when the keyword set changes), so checking a message is a single
+    scan of its casefolded text whose cost barely grows with the number of keywords; a
+    handful of keywords are just tested one by one. With word_boundary=True a keyword only
+    matches as a whole word ("Al" won't hit "Alright").
+    """
+
+    def __init__(self, keywords=(), word_boundary=KEYWORD_WORD_BOUNDARY):
+        self.word_boundary = word_boundary
+        self.keywords = []
+        self._folded = set()
+        self._pattern = None
+        self.add(*keywords)
+
+    def add(self, *keywords):
+        """Adds keywords (ignoring blanks and case-insensitive duplicates) and recompiles if needed."""
+        added = False
+        for keyword in keywords:
+            keyword = (keyword or "").strip()
+            if keyword and keyword.casefold() not in self._folded:
+                self._folded.add(keyword.casefold())
+                self.keywords.append(keyword)
+                added = True
+        if added:
+            self._compile()
+
+    def _compile(self):
+        if self.word_boundary:
+            # The leading lookbehind already fails fast inside words, so the plain trie is cheaper here
+            trie = {}
+            for keyword in self._folded:
+                node = trie
+                for ch in keyword:
+                    node = node.setdefault(ch, {})
+                node[""] = {} # End of a keyword
+            pattern = rf"(?<!\w)(?:{_trie_pattern(trie)})(?!\w)"
+        else:
+            pattern = _anchored_pattern(self._folded)
+        # Matching casefolded text against a casefolded pattern avoids re.IGNORECASE,
+        # which makes sre compare every branch case-insensitively and is ~5x slower
+        self._pattern = re.compile(pattern)
+        logger.info(f"Compiled keyword matcher for {len(self.keywords)} keywords.")
+
+    def search(self, text):
+        """True if any keyword occurs in text."""
+        if not text or not self._folded:
+            return False
+        text = text.casefold()
+        if not self.word_boundary and len(self._folded) <= SCAN_MAX_KEYWORDS:
+            return any(keyword in text for keyword in self._folded)
+        return self._pattern.search(text) is not None
+
+    def matches(self, message):
+        """True if a message's text or caption contains a keyword."""
+        return self.search(message.text) or self.search(message.caption)
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def __repr__(self):
+        return f"KeywordMatcher({self.keywords})"
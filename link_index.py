@@ -0,0 +1,95 @@
+import json
+import os
+import logging
+from persistence import run_io, submit_io
+
+logger = logging.getLogger(__name__)
+
+LINK_INDEX_FILE = "link_index.jsonl"
+
+class LinkIndex:
+    """Persistent link -> Notion page_id hash index used for task deduplication.
+
+    Stored as JSON lines so registering a new task is a single append;
+    a full rebuild rewrites the file atomically. `links` is only read and changed
+    on the event loop thread; the I/O thread gets snapshots to read or write.
+    """
+
+    def __init__(self, path=LINK_INDEX_FILE):
+        self.path = path
+        self.links = {}
+        self.loaded = False
+
+    async def load(self):
+        """Loads the index from disk. Returns False if there is nothing to load."""
+        links = await run_io(self._read)
+        if links is None:
+            return False
+        self._adopt(links, written=links)
+        logger.info(f"Loaded link index with {len(links)} entries.")
+        return True
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return None
+
+        links = {}
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue # Torn write from a crash; the next rebuild repairs it
+                links[entry["link"]] = entry["id"]
+        return links
+
+    async def rebuild(self, links):
+        """
+        Replaces the whole index (e.g. after a full Notion scan) and rewrites the file.
+        Links added in memory meanwhile (pages created during the scan) are kept.
+        """
+        snapshot = {**links, **self.links}
+        await run_io(self._write, snapshot)
+        self._adopt(links, written=snapshot)
+        logger.info(f"Rebuilt link index with {len(self.links)} entries.")
+
+    def _adopt(self, links, written):
+        """Merges `links` under the in-memory ones and appends whatever the file (`written`) lacks."""
+        self.links = {**links, **self.links}
+        self.loaded = True
+        for link, page_id in self.links.items():
+            if written.get(link) != page_id:
+                submit_io(self._append, link, page_id)
+
+    def _write(self, links):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for link, page_id in links.items():
+                f.write(json.dumps({"link": link, "id": page_id}) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def get(self, link):
+        """Returns the page_id for a link, or None."""
+        return self.links.get(link)
+
+    def add(self, link, page_id):
+        """
+        Registers a link and appends it to the on-disk index. Until the index has been
+        loaded or fully rebuilt it is only kept in memory: a file holding just the new
+        links would be taken for the complete index on the next start.
+        """
+        if not link or not page_id or self.links.get(link) == page_id:
+            return
+        self.links[link] = page_id
+        if self.loaded:
+            submit_io(self._append, link, page_id) # In memory now; the disk append happens on the I/O thread
+
+    def _append(self, link, page_id):
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"link": link, "id": page_id}) + "\n")
+
+    def __contains__(self, link):
+        return link in self.links
+
+    def __len__(self):
+        return len(self.links)
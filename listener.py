@@ -1,12 +1,13 @@
 from pyrogram import Client, filters, handlers
 import pyrogram
-from config import API_ID, API_HASH, SESSION_STRING, KEYWORD_FILTER
+from config import API_ID, API_HASH, SESSION_STRING, KEYWORD_FILTER, CHAT_DEBOUNCE_BYPASS_SAVED, SUMMARY_PROGRESS_INTERVAL
 from agent import Agent
 from task_manager import TaskManager
 import logging
 import asyncio
 import os
 import sys
+import time
 import session_manager
 
 logger = logging.getLogger(__name__)
@@ -15,7 +16,17 @@ logger = logging.getLogger(__name__)
 intelligence_agent = Agent()
 tm = TaskManager()
 from discussion_buffer import DiscussionBuffer
-discussion_buffer = DiscussionBuffer()
+discussion_buffer = DiscussionBuffer(tm.storage)
+from summarizer import DiscussionSummarizer, SUMMARY_FAILED
+summarizer = DiscussionSummarizer(intelligence_agent)
+from chat_history import ChatHistoryCache, compact_message
+from keyword_matcher import KeywordMatcher
+chat_history = ChatHistoryCache()
+from debounce import ChatDebouncer
+from persistence import run_io
+from work_queue import PriorityWorkQueue, PRIORITY_DIRECT, PRIORITY_MENTION, PRIORITY_KEYWORD
+from metrics import MESSAGE_SECONDS, MESSAGE_E2E_SECONDS, stage
+from tracing import start_trace, current_trace_id
 
 # Initialize Client
 if SESSION_STRING:
@@ -25,6 +36,7 @@ else:
     app = Client("telegram_agent_session_local", api_id=API_ID, api_hash=API_HASH)
 
 async def message_handler(client, message):
+    received_at = time.monotonic() # Start of the end-to-end latency, carried through debounce and the queue
     # DEBUG: Log everything to understand what's happening
     sender_name = message.chat.title or message.chat.first_name or "Unknown"
     logger.info(f"DEBUG: Received msg from {sender_name} | ID: {message.chat.id} | Type: {message.chat.type} | Outgoing: {message.outgoing}")
@@ -34,27 +46,81 @@ async def message_handler(client, message):
         logger.info("Skipping: Text too short or empty")
         return
 
-    sender = message.chat.title if message.chat.title else message.chat.first_name
-    logger.info(f"Processing message from {sender}...")
+    # Saved Messages are commands to myself: skip the quiet window
+    if CHAT_DEBOUNCE_BYPASS_SAVED and client.me and message.chat.id == client.me.id:
+        await enqueue_analysis(client, message, received_at=received_at)
+        return
 
-    # Fetch recent context (last 10 messages) for better analysis
-    history = []
+    # Hold the trigger until the chat goes quiet, then analyze the whole burst once
+    debouncer.submit(client, message, received_at)
+
+def classify_message(client, message):
+    """Queue class for a trigger: Saved Messages/DMs, then mentions/replies, then keyword hits."""
+    if message.chat.type == pyrogram.enums.ChatType.PRIVATE or (client.me and message.chat.id == client.me.id):
+        return PRIORITY_DIRECT
+    if message.mentioned:
+        return PRIORITY_MENTION
+    reply = message.reply_to_message
+    if reply and reply.from_user and reply.from_user.is_self:
+        return PRIORITY_MENTION
+    return PRIORITY_KEYWORD
+
+async def enqueue_analysis(client, message, burst=None, received_at=None):
+    """Hands a (coalesced) trigger to the worker pool instead of running it on Pyrogram's dispatcher."""
+    burst = burst or [message]
+    priority = min(classify_message(client, m) for m in burst)
+    work_queue.submit(priority, process_message, client, message, burst, received_at)
+
+async def process_message(client, message, burst=None, received_at=None):
+    """
+    Analyzes a message (the last of `burst`, if several were coalesced) and files a task if needed.
+    `received_at` (time.monotonic() when the first message arrived) feeds the end-to-end latency.
+    """
+    start = time.perf_counter()
+    outcome = "error"
     try:
-        async for msg in client.get_chat_history(message.chat.id, limit=10):
-            sender_name = msg.chat.title or msg.from_user.first_name or "Unknown"
-            if msg.from_user:
-                sender_name = msg.from_user.first_name
-            history.append(f"{sender_name}: {msg.text or '[Media]'}")
-        history.reverse() # Oldest first
-    except Exception as e:
-        logger.warning(f"Failed to fetch history: {e}")
-        history = [f"{sender}: {message.text}"]
+        with start_trace("message", chat_id=message.chat.id, message_id=message.id, burst=len(burst or [message])) as trace:
+            outcome = await _analyze_and_file(client, message, burst)
+            if trace: trace.attrs["outcome"] = outcome
+    finally:
+        MESSAGE_SECONDS.observe(time.perf_counter() - start, outcome=outcome)
+        if received_at is not None: # Not for catch-up of messages missed while offline
+            MESSAGE_E2E_SECONDS.observe(time.monotonic() - received_at, outcome=outcome)
+
+async def _analyze_and_file(client, message, burst):
+    """The pipeline behind process_message; returns its outcome for the latency metrics."""
+    # Skip potential spam or minimal messages
+    if not message.text or len(message.text) < 2:
+        logger.info("Skipping: Text too short or empty")
+        return "skipped"
+
+    burst = burst or [message]
+    sender = message.chat.title if message.chat.title else message.chat.first_name
+    logger.info(f"Processing {len(burst)} message(s) from {sender} (trace {current_trace_id()})...")
+
+    # Recent context (last 10 messages, or the whole burst) for better analysis, from the local ring buffer
+    limit = max(10, len(burst))
+    records = chat_history.get(message.chat.id, limit=limit, upto_id=message.id)
+    if records is None:
+        # Cold chat: one MTProto round trip, then the buffer takes over
+        try:
+            with stage("get_chat_history"):
+                records = [compact_message(msg) async for msg in client.get_chat_history(message.chat.id, limit=limit)]
+            records.reverse() # Oldest first
+            chat_history.seed(message.chat.id, records)
+            records = chat_history.get(message.chat.id, limit=limit, upto_id=message.id) or records
+        except Exception as e:
+            logger.warning(f"Failed to fetch history: {e}")
+            records = [{"sender": sender, "text": message.text}]
+    history = [f"{r['sender']}: {r['text']}" for r in records]
 
     context_text = "\n".join(history)
 
     # Get Memory & Learning Context
-    recent_done = await tm.get_recent_done_tasks(limit=5)
-    preferences = await tm.get_preference_examples(limit=5)
+    with stage("recent_done"):
+        recent_done = await tm.get_recent_done_tasks(limit=5)
+    with stage("preferences"):
+        preferences = await tm.get_preference_examples(limit=5)
     
     memory_text = "Recent Finished Tasks:\n" + "\n".join([f"- {t['summary']}" for t in recent_done])
     memory_text += "\n\nUser Preferences (Learning):\n"
@@ -62,15 +128,17 @@ async def message_handler(client, message):
     memory_text += "\nREJECTED Tasks:\n" + "\n".join([f"- [P{t['priority']}] {t['summary']} (from {t['sender']}) " + (f"| Note: {', '.join(t['comments'])}" if t['comments'] else "") for t in preferences['rejected']])
 
     # Analyze with context AND memory
-    analysis = await intelligence_agent.analyze_message(context_text, sender, memory_text)
+    with stage("analyze"):
+        analysis = await intelligence_agent.analyze_message(context_text, sender, memory_text)
     logger.info(f"Analysis: {analysis}")
 
     # LOG AUDIT
     try:
-        await tm.log_audit(
-            message_data={"sender": sender, "text": message.text or "[Media/No Text]"},
-            evaluation=analysis
-        )
+        with stage("log_audit"):
+            await tm.log_audit(
+                message_data={"sender": sender, "text": "\n".join(m.text or "[Media/No Text]" for m in burst)},
+                evaluation=analysis
+            )
     except Exception as e:
         logger.error(f"Audit log failed: {e}")
 
@@ -85,18 +153,19 @@ async def message_handler(client, message):
             except Exception:
                 pass
                 
-            task_result = await tm.add_task(
-                priority=analysis.get('priority', 0),
-                summary=analysis.get('summary', 'No summary'),
-                sender=sender,
-                link=safe_link,
-                deadline=analysis.get('deadline'),
-                user_id=message.chat.id
-            )
+            with stage("add_task"):
+                task_result = await tm.add_task(
+                    priority=analysis.get('priority', 0),
+                    summary=analysis.get('summary', 'No summary'),
+                    sender=sender,
+                    link=safe_link,
+                    deadline=analysis.get('deadline'),
+                    user_id=message.chat.id
+                )
             
             if not task_result.get("is_new", True):
                 logger.info(f"Task already exists: {safe_link}. Skipping notification.")
-                return
+                return "duplicate"
 
             # Notify user (Silent Mode: Only to Saved Messages)
             notification_text = f"✅ **Task Added from {sender}**\nPriority: {analysis.get('priority', 0)}\nSummary: {analysis.get('summary', 'No summary')}\nLink: {safe_link}"
@@ -104,13 +173,24 @@ async def message_handler(client, message):
             # If the source was NOT Saved Messages, send a copy to Saved Messages so I know.
             # If it WAS Saved Messages, we can either reply or just let it be. 
             # User asked: "only send to my Saved Messages".
-            if message.chat.id != (await client.get_me()).id:
-                await client.send_message("me", notification_text)
-            else:
-                 # Optional: acknowledgment in Saved Messages (the user is "me")
-                 await message.reply(f"✅ **Task Added**\nPriority: {analysis.get('priority', 0)}")
+            with stage("send_message"):
+                if message.chat.id != (await client.get_me()).id:
+                    await client.send_message("me", notification_text)
+                else:
+                     # Optional: acknowledgment in Saved Messages (the user is "me")
+                     await message.reply(f"✅ **Task Added**\nPriority: {analysis.get('priority', 0)}")
+            return "task"
         except Exception as e:
             logger.error(f"Failed to add task or reply: {e}")
+            return "error"
+    return "ignored"
+
+work_queue = PriorityWorkQueue()
+debouncer = ChatDebouncer(enqueue_analysis)
+
+async def history_recorder(client, message):
+    """Feeds every incoming (or edited) message into the per-chat ring buffers."""
+    chat_history.record(message)
 
 async def group_digest_listener(client, message):
     """Buffers group messages for daily summary."""
@@ -137,14 +217,22 @@ async def command_handler(client, message):
     
     if command == "/summary":
         logger.info("Generating On-Demand Summary...")
-        await message.reply("🔄 Generating Group Discussion Digest...")
+        status = await message.reply("🔄 Generating Group Discussion Digest...")
         
-        buffer_text = discussion_buffer.get_grouped_text()
-        if not buffer_text:
+        grouped = await discussion_buffer.get_digest_input()
+        if not grouped:
              await message.reply("📭 No discussions recorded today.")
              return
-             
-        summary = await intelligence_agent.summarize_discussions(buffer_text)
+
+        last_edit = 0
+        async def report_progress(done, total):
+            nonlocal last_edit
+            now = asyncio.get_running_loop().time()
+            if done == total or now - last_edit >= SUMMARY_PROGRESS_INTERVAL:
+                last_edit = now
+                await status.edit_text(f"🔄 Generating Group Discussion Digest... ({done}/{total} parts)")
+
+        summary = await summarizer.summarize(grouped, on_progress=report_progress)
         await message.reply(summary)
         
         # Archive it? command usually implies just viewing. 
@@ -171,13 +259,20 @@ async def send_daily_briefing(app: Client, tm: TaskManager):
              
     # Part 2: Group Digest
     digest_text = ""
-    buffer_content = discussion_buffer.get_grouped_text()
-    if buffer_content:
+    upto_id = await discussion_buffer.last_point_id() # Points arriving during the digest wait for the next one
+    grouped = await discussion_buffer.get_digest_input(upto_id)
+    if grouped:
         logger.info("Summarizing Group Discussions...")
-        digest_text = await intelligence_agent.summarize_discussions(buffer_content)
-        # Archive
-        discussion_buffer.archive_daily_summary(digest_text)
-        discussion_buffer.clear() # Clear buffer after daily report
+        digest_text = await summarizer.summarize(
+            grouped, on_progress=lambda done, total: logger.info(f"Digest progress: {done}/{total} parts")
+        )
+        if digest_text == SUMMARY_FAILED:
+            # Keep the buffer so the next run retries (finished parts are cached)
+            logger.error("Daily digest failed; keeping discussion buffer for retry.")
+        else:
+            # Archive
+            await discussion_buffer.archive_daily_summary(digest_text, upto_id)
+            await discussion_buffer.clear(upto_id) # Clear the summarized points after the daily report
     
     # Combine
     final_text = "☀️ **Good Morning! Here is your Daily Briefing:**\n\n"
@@ -218,7 +313,7 @@ async def scheduler(app: Client, tm: TaskManager):
 
 
 
-def is_message_relevant(message, me_id, dynamic_keywords):
+def is_message_relevant(message, me_id, keyword_matcher):
     """Refactored logic to check if a message is relevant for the agent."""
     # 1. Saved Messages (Chat "me")
     if message.chat.id == me_id:
@@ -239,16 +334,7 @@ def is_message_relevant(message, me_id, dynamic_keywords):
         return True
     
     # 5. Keywords
-    if message.text:
-        text = message.text.lower()
-        if any(k.lower() in text for k in dynamic_keywords):
-            return True
-    if message.caption:
-        caption = message.caption.lower()
-        if any(k.lower() in caption for k in dynamic_keywords):
-            return True
-            
-    return False
+    return keyword_matcher.matches(message)
 
 def get_message_link(message):
     """Generates a safe link for the message to use as a unique ID."""
@@ -265,18 +351,15 @@ def get_message_link(message):
         chat_id_str = chat_id_str[4:]
     return f"https://t.me/c/{chat_id_str}/{message.id}"
 
-async def run_catch_up(app: Client, dynamic_keywords):
+async def run_catch_up(app: Client, keyword_matcher):
     """Scans recent dialogs for missed messages during downtime."""
     logger.info("♻️ Running Startup Catch-Up...")
     
-    # 0. Pre-fetch existing tasks for Deduplication
-    existing_tasks = await tm.get_tasks()
+    # 0. Load the link index for Deduplication
+    await tm.ensure_link_index()
     existing_links = set()
-    for t in existing_tasks:
-        if t.get('link'):
-            existing_links.add(t['link'])
             
-    logger.info(f"Loaded {len(existing_links)} existing task links for deduplication.")
+    logger.info(f"Loaded {len(tm.link_index)} existing task links for deduplication.")
     
     me = await app.get_me()
     me_id = me.id
@@ -302,16 +385,16 @@ async def run_catch_up(app: Client, dynamic_keywords):
             
             for msg in history:
                 # Basic relevance check
-                if is_message_relevant(msg, me_id, dynamic_keywords):
+                if is_message_relevant(msg, me_id, keyword_matcher):
                     # Deduplication Check
                     msg_link = get_message_link(msg)
-                    if msg_link in existing_links:
+                    if msg_link in tm.link_index or msg_link in existing_links:
                         # logger.info(f"Skipping Duplicate: {msg_link}")
                         skipped += 1
                         continue
                         
                     try:
-                        await message_handler(app, msg)
+                        await process_message(app, msg)
                         count += 1
                         # Add to local set to prevent adding same task twice in one run
                         existing_links.add(msg_link) 
@@ -338,8 +421,8 @@ async def start_listener():
     # Register Handlers
     logger.info("Registering handlers...")
 
-    # Dynamic Keywords
-    dynamic_keywords = list(KEYWORD_FILTER) # Start with config keywords
+    # Dynamic Keywords (compiled once; recompiled only when keywords are added)
+    keyword_matcher = KeywordMatcher(KEYWORD_FILTER) # Start with config keywords
     
     # Custom Filter: Start Listener
     # 1. Replies to ME
@@ -353,19 +436,14 @@ async def start_listener():
         if message.reply_to_message and message.reply_to_message.from_user and message.reply_to_message.from_user.is_self:
             return True
         
-        if message.text:
-            text = message.text.lower()
-            if any(k.lower() in text for k in dynamic_keywords):
-                return True
-        if message.caption:
-            caption = message.caption.lower()
-            if any(k.lower() in caption for k in dynamic_keywords):
-                return True
-                
-        return False
+        return keyword_matcher.matches(message)
 
     custom_relevance_filter = filters.create(relevant_filter)
 
+    # Register History Recorder first (group -1 runs before the analysis handler)
+    app.add_handler(handlers.MessageHandler(history_recorder), group=-1)
+    app.add_handler(handlers.EditedMessageHandler(history_recorder), group=-1)
+
     # Register Group Digest Listener (Catch-all for groups)
     app.add_handler(handlers.MessageHandler(group_digest_listener, filters.group), group=1)
     
@@ -383,7 +461,7 @@ async def start_listener():
     
     if updated:
         logger.info("Session updated. Saving and restarting...")
-        session_manager.update_env_session(new_session)
+        await run_io(session_manager.update_env_session, new_session)
         
         # CRITICAL FIX: Update os.environ so the new process inherits the new session
         # otherwise load_dotenv will see the old empty env var and not override it.
@@ -399,18 +477,20 @@ async def start_listener():
     
     # Init Keywords
     me = await app.get_me()
-    if me.first_name: dynamic_keywords.append(me.first_name)
-    if me.last_name: dynamic_keywords.append(me.last_name)
-    if me.username: dynamic_keywords.append(me.username)
-    logger.info(f"Initialized Keyword Filter: {dynamic_keywords}")
+    keyword_matcher.add(me.first_name, me.last_name, me.username)
+    logger.info(f"Initialized Keyword Filter: {keyword_matcher.keywords}")
     
     # START CATCH-UP
     # Disabled to prevent duplicates: Pyrogram automatically fetches missed updates on persistent sessions.
-    # await run_catch_up(app, dynamic_keywords)
+    # await run_catch_up(app, keyword_matcher)
     logger.info("Startup Catch-Up DISABLED (Relying on Native Updates)")
     
+    # Warm the task cache (one full Notion fetch) and start its background refresh
+    await tm.start_cache()
+
     # Start Scheduler
     asyncio.create_task(scheduler(app, tm))
+    asyncio.create_task(summarizer.run_rolling(discussion_buffer))
 
     try:
         await app.send_message("me", "⚡ **Agent Just Started** ⚡\n_Group Digest Active._")
@@ -10,8 +10,9 @@ try:
 except RuntimeError:
     asyncio.set_event_loop(asyncio.new_event_loop())
 
-from listener import start_listener, tm, app as client_app
+from listener import start_listener, tm, intelligence_agent, work_queue, debouncer, discussion_buffer, app as client_app
 import server
+from persistence import LoopLagMonitor, shutdown_io
 import pyrogram
 
 # Configure Logging
@@ -49,6 +50,10 @@ async def main():
 
     # Dependency Injection
     server.task_manager = tm
+    server.agent = intelligence_agent
+    server.work_queue = work_queue
+    server.debouncer = debouncer
+    server.discussion_buffer = discussion_buffer
     server.notification_callback = on_task_done
 
     logger.info("Starting Telegram Intelligence Agent...")
@@ -61,6 +66,7 @@ async def main():
 
     # 2. Run Server as background task
     server_task = asyncio.create_task(run_server())
+    lag_monitor_task = asyncio.create_task(LoopLagMonitor().run())
 
     # 3. Idle until signal
     try:
@@ -70,6 +76,8 @@ async def main():
     finally:
         logger.info("Shutting down services...")
         
+        lag_monitor_task.cancel()
+
         # Stop Server
         server_task.cancel()
         try:
@@ -77,6 +85,11 @@ async def main():
         except asyncio.CancelledError:
             pass
             
+        # Flush queued Notion writes before the loop goes away
+        await tm.notion_sync.write_queue.drain(timeout=10.0)
+        await tm.storage.aclose()
+        shutdown_io() # Let queued disk writes finish
+
         logger.info("Stopping Telegram Client...")
         if client_app.is_connected:
             try:
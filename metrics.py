@@ -0,0 +1,180 @@
+import re
+import time
+from contextlib import contextmanager
+from tracing import span
+
+# Latency buckets (seconds) covering local reads up to slow LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs: return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def _number(value):
+    if value == float("inf"): return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        return self._header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in self._values.items()]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def render(self):
+        return self._header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in self._values.items()]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0] # bucket counts, sum, count
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[0][i] += 1
+                break
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = self._header()
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+class Registry:
+    """
+    Minimal in-process metrics registry rendered in the Prometheus text format
+    (version 0.0.4). Updated from the event loop only, so no locking.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._add(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._add(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# Message pipeline
+MESSAGE_SECONDS = REGISTRY.histogram(
+    "agent_message_seconds", "Analysis of one trigger, from leaving the handler queue", ("outcome",))
+MESSAGE_E2E_SECONDS = REGISTRY.histogram(
+    "agent_message_e2e_seconds", "One trigger from receipt of its first message to the end of its analysis, "
+    "including debounce and handler queue wait", ("outcome",))
+STAGE_SECONDS = REGISTRY.histogram(
+    "agent_stage_seconds", "Time spent in each message pipeline stage", ("stage",))
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "agent_queue_wait_seconds", "Time a trigger waited in the handler queue", ("priority",))
+ERRORS = REGISTRY.counter(
+    "agent_errors_total", "Errors by pipeline stage and exception type", ("stage", "type"))
+
+# External calls
+LLM_REQUESTS = REGISTRY.counter(
+    "agent_llm_requests_total", "Gemini requests by kind and outcome", ("kind", "status"))
+LLM_SECONDS = REGISTRY.histogram(
+    "agent_llm_request_seconds", "Gemini request latency", ("kind",))
+LLM_TOKENS = REGISTRY.counter(
+    "agent_llm_tokens_total", "Gemini tokens by kind and direction (in = prompt, out = response)", ("kind", "direction"))
+NOTION_REQUESTS = REGISTRY.counter(
+    "agent_notion_requests_total", "Notion API attempts by endpoint and outcome", ("endpoint", "status"))
+NOTION_SECONDS = REGISTRY.histogram(
+    "agent_notion_request_seconds", "Notion API attempt latency", ("endpoint",))
+
+# Caches and queues
+CACHE_LOOKUPS = REGISTRY.counter(
+    "agent_cache_lookups_total", "Cache lookups by cache and result", ("cache", "result"))
+QUEUE_DEPTH = REGISTRY.gauge(
+    "agent_queue_depth", "Jobs waiting per queue", ("queue",))
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "agent_event_loop_lag_seconds", "Event loop scheduling delay", buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+
+@contextmanager
+def stage(name):
+    """Times a pipeline stage (also a span of the current trace); exceptions are counted by type and re-raised."""
+    start = time.perf_counter()
+    try:
+        with span(name):
+            yield
+    except Exception as e:
+        ERRORS.inc(stage=name, type=type(e).__name__)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=name)
+
+def endpoint_name(method):
+    """'pages.update' for client.pages.update, 'blocks.children.append', 'search' for client.search."""
+    if hasattr(method, "__self__"):
+        owner, names = type(method.__self__).__name__, [method.__name__]
+    else:
+        owner, names = type(method).__name__, [] # Callable endpoint object, e.g. client.search
+    if not owner.endswith("Endpoint"):
+        return getattr(method, "__name__", owner)
+    parts = re.findall(r"[A-Z][a-z]*", owner[:-len("Endpoint")])
+    return ".".join(p.lower() for p in parts + names)
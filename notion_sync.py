@@ -1,9 +1,287 @@
-from notion_client import AsyncClient
+from notion_client import AsyncClient, RequestTimeoutError
+from collections import OrderedDict
+from contextlib import aclosing
+from config import NOTION_RATE_LIMIT, NOTION_MAX_RETRIES, NOTION_WRITE_WORKERS
+from metrics import NOTION_REQUESTS, NOTION_SECONDS, endpoint_name
+from tracing import span, detach
+import asyncio
+import datetime
+import httpx
 import logging
 import os
+import random
+import re
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
+SEARCH_PAGE_SIZE = 100 # Notion's maximum page_size
+RETRYABLE_STATUS = {409, 429, 500, 502, 503, 504}
+RETRY_BASE_DELAY = 0.5 # Seconds, doubled on every attempt
+RETRY_MAX_DELAY = 30.0
+RICH_TEXT_LIMIT = 2000 # Notion's maximum characters per rich text object
+BLOCK_APPEND_LIMIT = 100 # Notion's maximum children per append request
+LOCAL_ID_PREFIX = "local-" # Provisional ids for pages still waiting in the write queue
+COMMENT_PATTERN = re.compile(r"\[(.*?)\] (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) (.*?): (.*)", re.DOTALL)
+
+STATUS_MAP = {
+    "active": "Active",
+    "done": "Done",
+    "rejected": "Rejected"
+}
+
+def _is_retryable(error):
+    """Rate limits, Notion 5xx/conflicts and network timeouts are worth retrying."""
+    if getattr(error, "status", None) in RETRYABLE_STATUS:
+        return True
+    return isinstance(error, (RequestTimeoutError, httpx.TransportError))
+
+def _comment_text(page):
+    """Returns the raw AgentComments text of a retrieved page."""
+    rich_text = page.get("properties", {}).get("AgentComments", {}).get("rich_text", [])
+    return "".join([t.get("text", {}).get("content", "") for t in rich_text])
+
+def _comment_block(line):
+    """A paragraph block holding one comment line (split across rich text objects, so nothing is cut)."""
+    chunks = [line[i:i + RICH_TEXT_LIMIT] for i in range(0, len(line), RICH_TEXT_LIMIT)] or [""]
+    return {
+        "object": "block",
+        "type": "paragraph",
+        "paragraph": {"rich_text": [{"type": "text", "text": {"content": c}} for c in chunks]}
+    }
+
+def _comment_line(comment):
+    """The stored form of a comment: "[id] YYYY-MM-DD HH:MM:SS Sender: Text"."""
+    return f"[{comment['id']}] {comment['timestamp']} {comment.get('sender') or 'Unknown'}: {comment.get('text') or ''}"
+
+def _block_text(block):
+    rich_text = block.get(block.get("type", ""), {}).get("rich_text", [])
+    return "".join(t.get("plain_text") or t.get("text", {}).get("content", "") for t in rich_text)
+
+class TokenBucket:
+    """Async token-bucket rate limiter: `rate` requests per second with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Waits until a token is available and takes it (FIFO across waiters)."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class _PendingWrite:
+    """All not-yet-sent changes for one page, merged into a single request."""
+
+    def __init__(self, key):
+        self.key = key
+        self.create = None # Full property set when the page does not exist in Notion yet
+        self.properties = {}
+        self.comments = [] # (comment_id, formatted line) to append as page blocks
+        self.deleted_blocks = {} # comment_id -> block id (None if not known yet) to delete
+        self.deleted_comments = set() # Legacy comments to drop from the AgentComments property
+        self.enqueued_at = time.monotonic()
+        self.merged = 0
+        self.error = None # Set when the write is dropped after retries
+
+class NotionWriteQueue:
+    """
+    Write-behind queue for Notion mutations. Callers enqueue and return immediately;
+    workers send the writes under the shared rate limiter with retries. Repeated
+    writes to the same page are merged while they wait (three priority changes
+    become one PATCH), and a page is never written by two workers at once.
+    """
+
+    def __init__(self, sync, workers=NOTION_WRITE_WORKERS):
+        self.sync = sync
+        self.worker_count = workers
+        self._pending = OrderedDict() # page key -> _PendingWrite, oldest first
+        self._in_flight = set()
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers = []
+        self.stats_counters = {"enqueued": 0, "merged": 0, "sent": 0, "failed": 0}
+
+    @property
+    def depth(self):
+        """Pages with unsent writes (queued or being sent)."""
+        return len(self._pending) + len(self._in_flight)
+
+    def stats(self):
+        oldest = next(iter(self._pending.values()), None)
+        return {
+            "depth": self.depth,
+            "queued": len(self._pending),
+            "in_flight": len(self._in_flight),
+            "oldest_wait_seconds": round(time.monotonic() - oldest.enqueued_at, 3) if oldest else 0,
+            "retries": self.sync.retry_count,
+            **self.stats_counters
+        }
+
+    def has_pending(self, page_id):
+        """True while a page still has writes that Notion has not acknowledged."""
+        return page_id in self._pending or page_id in self._in_flight
+
+    def pending_comments(self, page_id):
+        """Returns (lines_to_append, deleted_ids) not yet written for a page."""
+        entry = self._pending.get(page_id)
+        if not entry: return [], set()
+        return [line for _, line in entry.comments], set(entry.deleted_comments) | set(entry.deleted_blocks)
+
+    def _entry(self, key):
+        entry = self._pending.get(key)
+        if entry:
+            entry.merged += 1
+            self.stats_counters["merged"] += 1
+        else:
+            entry = self._pending[key] = _PendingWrite(key)
+        self.stats_counters["enqueued"] += 1
+        self._ensure_workers()
+        self._idle.clear()
+        self._wakeup.set()
+        return entry
+
+    def enqueue_create(self, local_id, properties):
+        self._entry(local_id).create = dict(properties)
+
+    def enqueue_update(self, page_id, properties):
+        entry = self._entry(page_id)
+        if entry.create is not None:
+            entry.create.update(properties) # Page not created yet: fold into the create
+        else:
+            entry.properties.update(properties)
+
+    def enqueue_comment(self, page_id, comment_id, line):
+        self._entry(page_id).comments.append((comment_id, line))
+
+    def enqueue_comment_delete(self, page_id, comment_id, block_id=None, legacy=False):
+        entry = self._entry(page_id)
+        before = len(entry.comments)
+        entry.comments = [c for c in entry.comments if c[0] != comment_id]
+        if len(entry.comments) < before:
+            return # Never sent: dropping it is enough
+        if legacy:
+            entry.deleted_comments.add(comment_id)
+        else:
+            entry.deleted_blocks[comment_id] = block_id
+
+    def _ensure_workers(self):
+        """Starts the workers lazily so they attach to the running loop."""
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def drain(self, timeout=None):
+        """Waits until every queued write has been sent (used on shutdown)."""
+        if self.depth:
+            logger.info(f"Flushing {self.depth} pending Notion writes...")
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Notion write queue not drained; {self.depth} pages unsent.")
+
+    async def _worker(self):
+        detach() # Writes outlive the message that queued them
+        while True:
+            key = next((k for k in self._pending if k not in self._in_flight), None)
+            if key is None:
+                if not self.depth: self._idle.set()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            entry = self._pending.pop(key)
+            self._in_flight.add(key)
+            try:
+                await self._flush(entry)
+                self.stats_counters["sent"] += 1
+            except Exception as e:
+                self.stats_counters["failed"] += 1
+                logger.error(f"Dropping Notion write for {key} after retries: {e}")
+                entry.error = f"{type(e).__name__}: {e}"
+                self.sync._write_failed(key, entry)
+            finally:
+                self._in_flight.discard(key)
+                self._wakeup.set() # Writes queued for this page meanwhile can go now
+
+    async def _flush(self, entry):
+        client = self.sync._get_client()
+
+        if entry.create is not None:
+            kwargs = {}
+            if entry.comments:
+                # Block ids aren't returned here; deleting one of these later looks it up once
+                kwargs["children"] = [_comment_block(line) for _, line in entry.comments[:BLOCK_APPEND_LIMIT]]
+            new_page = await self.sync._request(
+                client.pages.create,
+                parent={"database_id": self.sync.database_id},
+                properties=dict(entry.create),
+                **kwargs
+            )
+            logger.info(f"Synced task to Notion: {new_page['id']}")
+            self.sync.mark_page_created(entry.key, new_page["id"])
+            # A create takes at most BLOCK_APPEND_LIMIT children: the rest are appended in batches
+            for comment_id, line in entry.comments[BLOCK_APPEND_LIMIT:]:
+                self.enqueue_comment(new_page["id"], comment_id, line)
+            return
+
+        page_id = self.sync.resolve_id(entry.key)
+        if page_id.startswith(LOCAL_ID_PREFIX):
+            raise ValueError("page was never created in Notion")
+
+        properties = dict(entry.properties)
+        if entry.deleted_comments:
+            # Legacy comments live in the AgentComments property: read, drop the lines, write back
+            page = await self.sync._request(client.pages.retrieve, page_id)
+            lines = [l for l in _comment_text(page).split("\n") if l]
+            lines = [l for l in lines if not any(f"[{c}]" in l for c in entry.deleted_comments)]
+            properties["AgentComments"] = {
+                "rich_text": [{"text": {"content": "\n".join(lines)[:RICH_TEXT_LIMIT]}}]
+            }
+
+        if properties:
+            await self.sync._request(client.pages.update, page_id=page_id, properties=properties)
+        for start in range(0, len(entry.comments), BLOCK_APPEND_LIMIT):
+            # Comments are page blocks: appending needs no read and never rewrites the others
+            batch = entry.comments[start:start + BLOCK_APPEND_LIMIT]
+            response = await self.sync._request(
+                client.blocks.children.append, block_id=page_id, children=[_comment_block(line) for _, line in batch]
+            )
+            blocks = {comment_id: block["id"] for (comment_id, _), block in zip(batch, response.get("results", []))}
+            self.sync._comment_blocks_written(page_id, blocks)
+        if entry.deleted_blocks:
+            await self._delete_comment_blocks(client, page_id, entry.deleted_blocks)
+        logger.info(
+            f"Updated Notion Page {page_id} ({', '.join(properties) or 'no properties'}, "
+            f"+{len(entry.comments)}/-{len(entry.deleted_blocks) + len(entry.deleted_comments)} comments, "
+            f"{entry.merged + 1} writes merged)"
+        )
+
+    async def _delete_comment_blocks(self, client, page_id, deleted):
+        """Deletes comment blocks, listing the page's blocks once if some block ids are unknown."""
+        deleted = dict(deleted)
+        if None in deleted.values():
+            async for block in self.sync.iter_child_blocks(page_id):
+                for comment_id, block_id in deleted.items():
+                    if block_id is None and _block_text(block).startswith(f"[{comment_id}]"):
+                        deleted[comment_id] = block["id"]
+        for comment_id, block_id in deleted.items():
+            if block_id is None:
+                logger.warning(f"Comment {comment_id} not found on Notion page {page_id}; skipping.")
+                continue
+            await self.sync._request(client.blocks.delete, block_id=block_id)
+
 class NotionSync:
     def __init__(self):
         self.notion = None
@@ -21,6 +299,18 @@ class NotionSync:
                 self.database_id = f"{self.database_id[:8]}-{self.database_id[8:12]}-{self.database_id[12:16]}-{self.database_id[16:20]}-{self.database_id[20:]}"
                 
         self.token = os.getenv("NOTION_TOKEN")
+
+        # Newest last_edited_time seen so far; fetch_changes() only reads pages edited since
+        self.sync_watermark = None
+
+        # Every Notion call shares one rate limiter; mutations go through the write queue
+        self.rate_limiter = TokenBucket(NOTION_RATE_LIMIT)
+        self.retry_count = 0
+        self.write_queue = NotionWriteQueue(self)
+        self.id_aliases = {} # provisional local id -> real page id
+        self.on_page_created = [] # callbacks(local_id, page_id)
+        self.on_comment_blocks = [] # callbacks(page_id, {comment_id: block_id}) after comments are appended
+        self.on_write_failed = [] # callbacks(key, entry) when a queued write is dropped after retries
         
     def _get_client(self):
         """Lazy initialization of AsyncClient to ensure it attaches to the current loop."""
@@ -29,71 +319,110 @@ class NotionSync:
             logger.info("Notion AsyncClient initialized (Lazy).")
         return self.notion
 
-    async def create_task_page(self, task):
-        """Creates a page in the database asynchronously."""
+    async def _request(self, method, *args, **kwargs):
+        """Calls a Notion endpoint under the rate limiter, retrying 429/5xx with exponential backoff."""
+        endpoint = endpoint_name(method)
+        with span(f"notion.{endpoint}") as attrs:
+            return await self._attempt(endpoint, method, args, kwargs, attrs)
+
+    async def _attempt(self, endpoint, method, args, kwargs, attrs):
+        for attempt in range(NOTION_MAX_RETRIES + 1):
+            attrs["attempts"] = attempt + 1
+            await self.rate_limiter.acquire()
+            start = time.perf_counter()
+            try:
+                result = await method(*args, **kwargs)
+                NOTION_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+                NOTION_REQUESTS.inc(endpoint=endpoint, status="ok")
+                return result
+            except Exception as e:
+                NOTION_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+                retry = attempt < NOTION_MAX_RETRIES and _is_retryable(e)
+                NOTION_REQUESTS.inc(endpoint=endpoint, status="retry" if retry else "error")
+                if not retry:
+                    raise
+                delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt) * random.uniform(0.5, 1.0)
+                self.retry_count += 1
+                logger.warning(f"Notion request failed ({e}); retry {attempt + 1}/{NOTION_MAX_RETRIES} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def resolve_id(self, page_id):
+        """Maps a provisional local id to its real Notion page id once the page exists."""
+        return self.id_aliases.get(page_id, page_id)
+
+    def mark_page_created(self, local_id, page_id):
+        """
+        Records that the page queued under provisional `local_id` exists as `page_id` and
+        notifies on_page_created. Called by the write queue, and on startup for pages
+        created before a restart that lost the re-key.
+        """
+        self.id_aliases[local_id] = page_id
+        for callback in self.on_page_created:
+            try:
+                callback(local_id, page_id)
+            except Exception as e:
+                logger.error(f"on_page_created callback failed: {e}")
+
+    def _write_failed(self, key, entry):
+        for callback in self.on_write_failed:
+            try:
+                callback(key, entry)
+            except Exception as e:
+                logger.error(f"on_write_failed callback failed: {e}")
+
+    def _comment_blocks_written(self, page_id, blocks):
+        for callback in self.on_comment_blocks:
+            try:
+                callback(page_id, blocks)
+            except Exception as e:
+                logger.error(f"on_comment_blocks callback failed: {e}")
+
+    async def create_task_page(self, task, local_id=None):
+        """
+        Queues a page for creation and returns a provisional local id immediately.
+        The real page id is reported through on_page_created once Notion accepts it;
+        writes made against the local id meanwhile are folded into the create.
+        Passing the `local_id` of a stored task (and its `comments`) re-queues a page
+        that was never created, e.g. because the queue was lost in a restart.
+        """
         if not self._get_client() or not self.database_id: return None
 
-        try:
-            priority_val = task.get('priority', 0)
-            
-            # Map Status
-            status_map = {
-                "active": "Active",
-                "done": "Done",
-                "rejected": "Rejected"
+        status_val = STATUS_MAP.get(task.get("status", "active"), "Active")
+        local_id = local_id or LOCAL_ID_PREFIX + uuid.uuid4().hex
+        self.write_queue.enqueue_create(local_id, {
+            "Name": {
+                "title": [{"text": {"content": task['summary']}}]
+            },
+            "Status": {
+                "status": {"name": status_val}
+            },
+            "Priority": {
+                "number": task.get('priority', 0)
+            },
+            "Sender": {
+                "rich_text": [{"text": {"content": task.get('sender', 'Unknown')}}]
+            },
+            "Link": {
+                "url": task.get('link') if task.get('link') else None
             }
-            status_val = status_map.get(task.get("status", "active"), "Active")
-
-            new_page = await self._get_client().pages.create(
-                parent={"database_id": self.database_id},
-                properties={
-                    "Name": {
-                        "title": [{"text": {"content": task['summary']}}]
-                    },
-                    "Status": {
-                        "status": {"name": status_val}
-                    },
-                    "Priority": {
-                        "number": priority_val
-                    },
-                    "Sender": {
-                        "rich_text": [{"text": {"content": task.get('sender', 'Unknown')}}]
-                    },
-                    "Link": {
-                        "url": task.get('link') if task.get('link') else None
-                    }
-                }
-            )
-            logger.info(f"Synced task to Notion: {new_page['id']}")
-            return new_page['id']
-            
-        except Exception as e:
-            logger.error(f"Failed to sync to Notion: {e}")
-            return None
+        })
+        for comment in reversed(task.get("comments") or []): # Stored newest first
+            self.write_queue.enqueue_comment(local_id, comment["id"], _comment_line(comment))
+        logger.info(f"Queued task for Notion: {local_id}")
+        return local_id
 
     async def update_task_status(self, page_id, status):
-        """Updates the status select property asynchronously."""
-        if not self.notion or not page_id: return
+        """Queues a Status update; returns as soon as it is accepted locally."""
+        if not self._get_client() or not page_id: return False
 
-        try:
-            status_map = {
-                "active": "Active",
-                "done": "Done",
-                "rejected": "Rejected"
+        status_val = STATUS_MAP.get(status, "Active")
+        self.write_queue.enqueue_update(self.resolve_id(page_id), {
+            "Status": {
+                "status": {"name": status_val}
             }
-            status_val = status_map.get(status, "Active")
-            
-            await self.notion.pages.update(
-                page_id=page_id,
-                properties={
-                    "Status": {
-                        "status": {"name": status_val}
-                    }
-                }
-            )
-            logger.info(f"Updated Notion Page {page_id} to {status_val}")
-        except Exception as e:
-            logger.error(f"Failed to update Notion Page: {e}")
+        })
+        logger.info(f"Queued Notion Page {page_id} status -> {status_val}")
+        return True
 
     async def find_task_by_link(self, link):
         """Checks if a task with the given link already exists using search asynchronously."""
@@ -101,7 +430,8 @@ class NotionSync:
         
         try:
             # Search for pages (recent typically appear first in search results)
-            response = await self.notion.search(
+            response = await self._request(
+                self._get_client().search,
                 filter={"value": "page", "property": "object"},
                 sort={"direction": "descending", "timestamp": "last_edited_time"}
             )
@@ -124,6 +454,94 @@ class NotionSync:
             logger.error(f"Failed to check task existence via search: {e}")
             return None
 
+    async def _search_page(self, cursor=None):
+        """Fetches one page of search results, newest edits first."""
+        kwargs = {
+            "filter": {"value": "page", "property": "object"},
+            "sort": {"direction": "descending", "timestamp": "last_edited_time"},
+            "page_size": SEARCH_PAGE_SIZE
+        }
+        if cursor: kwargs["start_cursor"] = cursor
+        return await self._request(self._get_client().search, **kwargs)
+
+    async def iter_search_pages(self, prefetch=True):
+        """
+        Async generator over raw search result pages, following next_cursor.
+        With prefetch, the next page is requested before the current one is handed
+        to the caller, so parsing overlaps with the network round trip. Callers that
+        usually stop after the first page (delta sync) pass prefetch=False.
+        """
+        if not self._get_client() or not self.database_id: return
+
+        pending = asyncio.ensure_future(self._search_page())
+        try:
+            while pending:
+                response = await pending
+                pending = None
+                next_cursor = response.get("next_cursor") if response.get("has_more") else None
+                if next_cursor and prefetch:
+                    pending = asyncio.ensure_future(self._search_page(next_cursor))
+                    await asyncio.sleep(0) # Let the prefetch send its request before we parse
+                yield response
+                if next_cursor and not pending:
+                    pending = asyncio.ensure_future(self._search_page(next_cursor))
+        finally:
+            # Consumer stopped early (or failed): don't leave the prefetch running
+            if pending:
+                pending.cancel()
+
+    async def stream_tasks(self):
+        """Async generator yielding task dicts as result pages arrive. Raises on API errors."""
+        async for response in self.iter_search_pages():
+            for page in response.get("results", []):
+                task = self._parse_task(page)
+                if task: yield task
+
+    async def scan_links(self):
+        """Walks every search result page and returns {link: page_id} for this database."""
+        target_db_id = (self.database_id or "").replace("-", "")
+        links = {}
+        async for response in self.iter_search_pages():
+            for page in response.get("results", []):
+                page_db_id = page.get("parent", {}).get("database_id", "").replace("-", "")
+                if page_db_id != target_db_id: continue
+                link = page.get("properties", {}).get("Link", {}).get("url")
+                # Newest edit wins if the same link appears twice
+                if link and link not in links:
+                    links[link] = page["id"]
+        return links
+
+    async def iter_child_blocks(self, page_id):
+        """Async generator over a page's child blocks, following next_cursor. Raises on API errors."""
+        cursor = None
+        while True:
+            kwargs = {"block_id": page_id, "page_size": SEARCH_PAGE_SIZE}
+            if cursor: kwargs["start_cursor"] = cursor
+            response = await self._request(self._get_client().blocks.children.list, **kwargs)
+            for block in response.get("results", []):
+                yield block
+            if not response.get("has_more"): break
+            cursor = response.get("next_cursor")
+
+    async def fetch_comment_blocks(self, page_id):
+        """
+        Reads the comments mirrored as page blocks (paragraphs starting with "[<id>]"),
+        newest first, each with its `block_id`. Raises on API errors.
+        """
+        comments = []
+        async for block in self.iter_child_blocks(page_id):
+            if block.get("type") != "paragraph": continue
+            match = COMMENT_PATTERN.fullmatch(_block_text(block))
+            if match:
+                comments.append({
+                    "id": match.group(1),
+                    "timestamp": match.group(2),
+                    "sender": match.group(3),
+                    "text": match.group(4),
+                    "block_id": block["id"]
+                })
+        return comments[::-1]
+
     def _parse_comments_text(self, full_text):
         """Helper to parse raw comment text into structured list."""
         comments = []
@@ -150,184 +568,171 @@ class NotionSync:
                     })
         return comments[::-1] # Newest first
 
-    async def get_tasks(self):
-        """Fetches all tasks from Notion database using search asynchronously."""
-        if not self._get_client() or not self.database_id: return []
+    def _parse_task(self, page):
+        """Converts a Notion page into the internal task dict, or None if it belongs to another database."""
+        # Verify DB ID
+        page_db_id = page.get("parent", {}).get("database_id", "").replace("-", "")
+        target_db_id = self.database_id.replace("-", "")
+        if page_db_id != target_db_id: return None
 
-        try:
-            response = await self._get_client().search(
-                filter={"value": "page", "property": "object"},
-                sort={"direction": "descending", "timestamp": "last_edited_time"}
-            )
-            
-            tasks = []
-            for page in response.get("results", []):
-                # Verify DB ID
-                page_db_id = page.get("parent", {}).get("database_id", "").replace("-", "")
-                target_db_id = self.database_id.replace("-", "")
-                
-                if page_db_id != target_db_id: continue
+        props = page.get("properties", {})
 
-                props = page.get("properties", {})
-                
-                # Safe Extraction Helpers
-                def get_title(p):
-                    return p.get("title", [])[0].get("text", {}).get("content", "") if p.get("title") else "Untitled"
-                
-                def get_select(p):
-                    # Handle both 'select' and 'status' types
-                    if "select" in p: return p.get("select", {}).get("name", "") if p.get("select") else ""
-                    if "status" in p: return p.get("status", {}).get("name", "") if p.get("status") else ""
-                    return ""
-
-                def get_number(p):
-                    return p.get("number", 0)
-                
-                def get_rich_text(p):
-                    return p.get("rich_text", [])[0].get("text", {}).get("content", "") if p.get("rich_text") else ""
-                
-                def get_url(p):
-                    return p.get("url", "")
+        # Safe Extraction Helpers
+        def get_title(p):
+            return p.get("title", [])[0].get("text", {}).get("content", "") if p.get("title") else "Untitled"
 
-                status = get_select(props.get("Status", {})).lower()
-                summary = get_title(props.get("Name", {}))
-                
-                # Parse comments directly here to avoid N+1 fetches
-                comments_text = get_rich_text(props.get("AgentComments", {}))
-                comments = self._parse_comments_text(comments_text)
-
-                # Internal format
-                task = {
-                    "id": page["id"], # Use Notion Page ID as internal ID
-                    "summary": summary,
-                    "status": status if status else "active",
-                    "priority": get_number(props.get("Priority", {})),
-                    "sender": get_rich_text(props.get("Sender", {})),
-                    "link": get_url(props.get("Link", {})),
-                    "deadline": get_rich_text(props.get("Deadline", {})),
-                    "comments": comments, # Include comments
-                    "notion_page_id": page["id"]
-                }
-                tasks.append(task)
-                
-            return tasks
+        def get_select(p):
+            # Handle both 'select' and 'status' types
+            if "select" in p: return p.get("select", {}).get("name", "") if p.get("select") else ""
+            if "status" in p: return p.get("status", {}).get("name", "") if p.get("status") else ""
+            return ""
+
+        def get_number(p):
+            return p.get("number", 0)
+
+        def get_rich_text(p):
+            return p.get("rich_text", [])[0].get("text", {}).get("content", "") if p.get("rich_text") else ""
+
+        def get_url(p):
+            return p.get("url", "")
+
+        status = get_select(props.get("Status", {})).lower()
+        summary = get_title(props.get("Name", {}))
+
+        # Parse comments directly here to avoid N+1 fetches
+        comments_text = get_rich_text(props.get("AgentComments", {}))
+        comments = self._parse_comments_text(comments_text)
+
+        # Internal format
+        return {
+            "id": page["id"], # Use Notion Page ID as internal ID
+            "summary": summary,
+            "status": status if status else "active",
+            "priority": get_number(props.get("Priority", {})),
+            "sender": get_rich_text(props.get("Sender", {})),
+            "link": get_url(props.get("Link", {})),
+            "deadline": get_rich_text(props.get("Deadline", {})),
+            "comments": comments, # Include comments
+            "notion_page_id": page["id"],
+            "last_edited_time": page.get("last_edited_time", "")
+        }
+
+    async def fetch_tasks(self):
+        """Fetches all tasks from Notion (every result page), raising on API errors."""
+        tasks = [task async for task in self.stream_tasks()]
+        self._advance_watermark(t["last_edited_time"] for t in tasks)
+        return tasks
+
+    def _advance_watermark(self, edited_times):
+        """Moves the delta-sync watermark to the newest last_edited_time seen."""
+        newest = max((t for t in edited_times if t), default=None)
+        if newest and (not self.sync_watermark or newest > self.sync_watermark):
+            self.sync_watermark = newest
+
+    async def fetch_changes(self, since=None):
+        """
+        Incremental sync: returns tasks edited at or after `since` (defaults to the
+        watermark left by the previous fetch), newest first. Search results are sorted
+        by last_edited_time, so the scan stops at the first older page instead of
+        walking the whole database. Without any watermark this is a full fetch.
+        Raises on API errors.
+        """
+        since = since or self.sync_watermark
+        if not since:
+            return await self.fetch_tasks()
+
+        changes = []
+        seen = []
+        async with aclosing(self.iter_search_pages(prefetch=False)) as pages:
+            async for response in pages:
+                done = False
+                for page in response.get("results", []):
+                    edited = page.get("last_edited_time", "")
+                    # Notion rounds last_edited_time to the minute, so pages stamped with the
+                    # watermark minute itself are re-read; callers drop those that match their copy.
+                    if edited < since:
+                        done = True
+                        break
+                    seen.append(edited)
+                    task = self._parse_task(page)
+                    if task: changes.append(task)
+                if done: break
+
+        self._advance_watermark(seen)
+        return changes
+
+    async def get_tasks(self):
+        """Fetches all tasks from Notion database using search asynchronously."""
+        try:
+            return await self.fetch_tasks()
         except Exception as e:
             logger.error(f"Failed to fetch tasks from Notion: {e}")
             return []
 
 
     async def get_comments(self, page_id):
-        """Fetches comments from the AgentComments text property."""
+        """Fetches comments from the page blocks and the legacy AgentComments property, including queued changes."""
         if not self._get_client() or not page_id: return []
+        page_id = self.resolve_id(page_id)
 
         try:
-            page = await self._get_client().pages.retrieve(page_id)
-            props = page.get("properties", {})
-            rich_text = props.get("AgentComments", {}).get("rich_text", [])
-            full_text = "".join([t.get("text", {}).get("content", "") for t in rich_text])
-            
-            return self._parse_comments_text(full_text)
+            full_text, blocks = "", []
+            if not page_id.startswith(LOCAL_ID_PREFIX):
+                page = await self._request(self._get_client().pages.retrieve, page_id)
+                full_text = _comment_text(page)
+                blocks = await self.fetch_comment_blocks(page_id)
+
+            added, deleted = self.write_queue.pending_comments(page_id)
+            lines = [l for l in full_text.split("\n") if l and not any(f"[{c}]" in l for c in deleted)]
+            comments = self._parse_comments_text("\n".join(lines + added))
+            comments += [{k: v for k, v in c.items() if k != "block_id"} for c in blocks if c["id"] not in deleted]
+            comments.sort(key=lambda c: c.get("timestamp") or "", reverse=True)
+            return comments
             
         except Exception as e:
             logger.error(f"Failed to fetch comments: {e}")
             return []
 
     async def add_comment(self, page_id, text, sender="Unknown"):
-        """Appends a comment to the AgentComments property."""
+        """Queues a comment to be appended as a page block and returns it immediately."""
         if not self._get_client() or not page_id: return None
-        
-        try:
-            import datetime
-            import uuid
-            
-            # timestamp
-            now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            comment_id = str(uuid.uuid4())[:8] # Short ID
-            
-            new_line = f"[{comment_id}] {now} {sender}: {text}"
-            
-            # 1. Get existing text
-            page = await self._get_client().pages.retrieve(page_id)
-            props = page.get("properties", {})
-            rich_text = props.get("AgentComments", {}).get("rich_text", [])
-            current_text = "".join([t.get("text", {}).get("content", "") for t in rich_text])
-            
-            updated_text = current_text + ("\n" if current_text else "") + new_line
-            
-            # 3. Update
-            await self._get_client().pages.update(
-                page_id=page_id,
-                properties={
-                    "AgentComments": {
-                        "rich_text": [{"text": {"content": updated_text[:2000]}}]
-                    }
-                }
-            )
-            logger.info(f"Added comment to {page_id}: {text}")
-            return {
-                "id": comment_id,
-                "timestamp": now,
-                "sender": sender,
-                "text": text
-            }
-        except Exception as e:
-            logger.error(f"Failed to add comment: {e}")
-            return None
 
-    async def delete_comment(self, page_id, comment_id):
-        """Removes a comment line by ID."""
+        # timestamp
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        comment_id = str(uuid.uuid4())[:8] # Short ID
+        comment = {
+            "id": comment_id,
+            "timestamp": now,
+            "sender": sender,
+            "text": text
+        }
+
+        self.write_queue.enqueue_comment(self.resolve_id(page_id), comment_id, _comment_line(comment))
+        logger.info(f"Queued comment for {page_id}: {text}")
+        return comment
+
+    async def delete_comment(self, page_id, comment_id, block_id=None, legacy=False):
+        """Queues removal of a comment: its page block, or its line in AgentComments if `legacy`."""
         if not self._get_client() or not page_id: return False
-        
-        try:
-            # 1. Get existing text
-            page = await self._get_client().pages.retrieve(page_id)
-            props = page.get("properties", {})
-            rich_text = props.get("AgentComments", {}).get("rich_text", [])
-            current_text = "".join([t.get("text", {}).get("content", "") for t in rich_text])
-            
-            if not current_text: return False
-            
-            # 2. Filter lines
-            lines = current_text.split("\n")
-            new_lines = [line for line in lines if f"[{comment_id}]" not in line]
-            
-            if len(lines) == len(new_lines):
-                logger.warning(f"Comment {comment_id} not found.")
-                return False
-                
-            updated_text = "\n".join(new_lines)
-            
-            # 3. Update
-            await self._get_client().pages.update(
-                page_id=page_id,
-                properties={
-                    "AgentComments": {
-                        "rich_text": [{"text": {"content": updated_text[:2000]}}]
-                    }
-                }
-            )
-            logger.info(f"Deleted comment {comment_id} from {page_id}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Failed to delete comment: {e}")
-            return False
+
+        self.write_queue.enqueue_comment_delete(self.resolve_id(page_id), comment_id, block_id=block_id, legacy=legacy)
+        logger.info(f"Queued deletion of comment {comment_id} from {page_id}")
+        return True
 
     async def update_task_priority(self, page_id, priority):
-        """Updates the Priority number property asynchronously."""
+        """Queues a Priority update; returns as soon as it is accepted locally."""
         if not self._get_client() or not page_id: return False
 
         try:
-            await self._get_client().pages.update(
-                page_id=page_id,
-                properties={
-                    "Priority": {
-                        "number": int(priority)
-                    }
-                }
-            )
-            logger.info(f"Updated Notion Page {page_id} Priority to {priority}")
-            return True
-        except Exception as e:
-            logger.error(f"Failed to update Notion Page Priority: {e}")
+            priority = int(priority)
+        except (TypeError, ValueError):
+            logger.error(f"Invalid priority for {page_id}: {priority}")
             return False
+
+        self.write_queue.enqueue_update(self.resolve_id(page_id), {
+            "Priority": {
+                "number": priority
+            }
+        })
+        logger.info(f"Queued Notion Page {page_id} priority -> {priority}")
+        return True
@@ -0,0 +1,84 @@
+import asyncio
+import functools
+import logging
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from config import LOOP_LAG_THRESHOLD_MS
+from metrics import LOOP_LAG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# One dedicated thread for all disk work: keeps it off the event loop, runs jobs in
+# submission order (so a read queued after a write sees it) and lets the SQLite
+# connection live on a single thread.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="disk-io")
+
+async def run_io(fn, *args, **kwargs):
+    """Runs blocking disk work on the I/O thread and waits for the result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+def submit_io(fn, *args, **kwargs):
+    """Queues blocking disk work on the I/O thread without waiting (failures are logged)."""
+    future = _executor.submit(fn, *args, **kwargs)
+    future.add_done_callback(_log_failure)
+    return future
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception():
+        logger.error(f"Background disk write failed: {future.exception()}")
+
+def shutdown_io(wait=True):
+    """Waits for queued disk work to finish (call on shutdown)."""
+    _executor.shutdown(wait=wait)
+
+class LoopLagMonitor:
+    """
+    Detects callbacks that block the event loop. The loop stamps a heartbeat every
+    `interval`; a watchdog thread that sees the heartbeat go stale by more than
+    `threshold` logs the loop thread's current stack (the culprit) once per stall,
+    and the loop logs the total lag when it gets control back.
+    """
+
+    def __init__(self, threshold_ms=LOOP_LAG_THRESHOLD_MS, interval=0.05):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.stats = {"stalls": 0, "max_lag_ms": 0.0}
+        self._beat = time.monotonic()
+        self._loop_thread = None
+        self._stop = threading.Event()
+
+    async def run(self):
+        if self.threshold <= 0:
+            return
+        self._loop_thread = threading.get_ident()
+        watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        watchdog.start()
+        logger.info(f"Event loop lag monitor started (threshold {self.threshold * 1000:.0f}ms).")
+        try:
+            while True:
+                expected = time.monotonic() + self.interval
+                self._beat = time.monotonic()
+                await asyncio.sleep(self.interval)
+                lag = time.monotonic() - expected
+                LOOP_LAG_SECONDS.observe(max(0.0, lag))
+                if lag > self.threshold:
+                    self.stats["stalls"] += 1
+                    self.stats["max_lag_ms"] = max(self.stats["max_lag_ms"], round(lag * 1000, 1))
+                    logger.warning(f"Event loop blocked for {lag * 1000:.0f}ms.")
+        finally:
+            self._stop.set()
+
+    def _watch(self):
+        reported = None
+        while not self._stop.wait(self.threshold / 2):
+            beat = self._beat
+            if time.monotonic() - beat > self.threshold + self.interval and reported != beat:
+                reported = beat
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    stack = "".join(traceback.format_stack(frame, limit=8))
+                    logger.warning(f"Event loop blocked > {self.threshold * 1000:.0f}ms in:\n{stack}")
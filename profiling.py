@@ -0,0 +1,75 @@
+import asyncio
+import cProfile
+import io
+import logging
+import pstats
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+MAX_SECONDS = 60
+MEMORY_FRAMES = 10 # Stack depth recorded per allocation while tracemalloc runs
+
+_busy = asyncio.Lock() # One profiling session at a time
+
+class ProfilerBusy(Exception):
+    pass
+
+async def profile_for(seconds, limit=40, sort="cumulative"):
+    """
+    Profiles the event loop thread (listener, server and workers all run on it) for
+    `seconds` and returns the top `limit` functions as pstats text.
+    """
+    if _busy.locked():
+        raise ProfilerBusy("A profiling session is already running")
+    async with _busy:
+        profiler = cProfile.Profile()
+        logger.info(f"Profiling the event loop for {seconds}s...")
+        profiler.enable()
+        try:
+            await asyncio.sleep(min(max(seconds, 0.1), MAX_SECONDS))
+        finally:
+            profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+def _stat(stat, diff=False):
+    frame = stat.traceback[0]
+    entry = {"location": f"{frame.filename}:{frame.lineno}", "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+    if diff:
+        entry["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+        entry["count_diff"] = stat.count_diff
+    return entry
+
+async def memory_top(seconds=10, limit=25):
+    """
+    Top allocation sites by line. If tracemalloc is already running this is a plain
+    snapshot; otherwise it traces for `seconds` and reports what grew, then stops.
+    """
+    if tracemalloc.is_tracing():
+        stats = _snapshot().statistics("lineno")[:limit]
+        return {"mode": "snapshot", "top": [_stat(s) for s in stats]}
+
+    if _busy.locked():
+        raise ProfilerBusy("A profiling session is already running")
+    async with _busy:
+        tracemalloc.start(MEMORY_FRAMES)
+        try:
+            baseline = _snapshot()
+            await asyncio.sleep(min(max(seconds, 0.1), MAX_SECONDS))
+            snapshot = _snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        stats = snapshot.compare_to(baseline, "lineno")[:limit]
+        return {
+            "mode": "growth",
+            "seconds": seconds,
+            "traced_kb": round(current / 1024, 1),
+            "peak_kb": round(peak / 1024, 1),
+            "top": [_stat(s, diff=True) for s in stats]
+        }
@@ -0,0 +1,135 @@
+import hashlib
+import logging
+import os
+import time
+from jinja2 import Environment
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4 # Rough estimate; good enough for budgeting
+RELOAD_CHECK_INTERVAL = 1.0 # Seconds between mtime checks
+
+_env = Environment(keep_trailing_newline=True)
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def trim_history(text, max_tokens):
+    """Drops the oldest lines of a chat history until it fits; the trigger (last line) is kept."""
+    max_chars = max(0, max_tokens) * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+
+    lines = text.split("\n")
+    kept, size = [], 0
+    for line in reversed(lines):
+        if size + len(line) + 1 > max_chars and kept:
+            break
+        kept.append(line)
+        size += len(line) + 1
+    kept.reverse()
+
+    result = "\n".join(kept)
+    if len(result) > max_chars: # The trigger alone is too long
+        result = result[:max(0, max_chars - 3)] + "..."
+    return result
+
+def trim_memory(text, max_tokens):
+    """
+    Shrinks the memory block by dropping the last list items ("- ...") of whichever
+    section is longest, so every section keeps its most recent entries.
+    """
+    max_chars = max(0, max_tokens) * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+
+    sections = [] # [header_lines, item_lines]
+    for line in text.split("\n"):
+        if line.startswith("- ") and sections:
+            sections[-1][1].append(line)
+        else:
+            sections.append([[line], []])
+
+    def size():
+        return sum(len(l) + 1 for header, items in sections for l in header + items)
+
+    while size() > max_chars:
+        longest = max(sections, key=lambda s: sum(len(l) for l in s[1]))
+        if not longest[1]:
+            break
+        longest[1].pop()
+
+    result = "\n".join(l for header, items in sections for l in header + items)
+    return result[:max_chars]
+
+class PromptTemplate:
+    """
+    A Jinja2 prompt file compiled once and recompiled only when its mtime changes.
+    `version` is a short hash of the source, so caches keyed on it are invalidated
+    by any edit to the prompt. Rendering with `batch=True` (and `count`) selects the
+    file's multi-conversation variant.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.version = None
+        self._template = None
+        self._mtime = None
+        self._checked = 0.0
+        self._overhead = 0
+        self._batch_overhead = 0
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._template is not None and now - self._checked < RELOAD_CHECK_INTERVAL:
+            return
+        self._checked = now
+
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self._mtime:
+                return
+            with open(self.path, "r") as f:
+                source = f.read()
+            template = _env.from_string(source)
+        except Exception as e:
+            # Keep serving the last good version if an edit breaks the file
+            logger.error(f"Failed to load {self.path}: {e}")
+            return
+
+        self._template = template
+        self._mtime = mtime
+        self.version = hashlib.sha256(source.encode("utf-8")).hexdigest()[:12]
+        self._overhead = estimate_tokens(template.render(memory_text="", message_text=""))
+        self._batch_overhead = estimate_tokens(template.render(memory_text="", message_text="", batch=True, count=0))
+        logger.info(f"Loaded prompt {self.path} (version {self.version})")
+
+    def get_version(self):
+        self._refresh()
+        return self.version or "fallback"
+
+    def overhead(self, batch=False):
+        """Tokens taken by the template itself, without memory and history."""
+        self._refresh()
+        return self._batch_overhead if batch else self._overhead
+
+    def fit(self, memory_text, message_text, budget):
+        """
+        Trims memory and chat history so the rendered prompt stays within `budget` tokens.
+        History gets priority (up to 60% of the room), memory takes what is left.
+        """
+        self._refresh()
+        room = max(0, budget - self._overhead)
+        if estimate_tokens(memory_text) + estimate_tokens(message_text) <= room:
+            return memory_text, message_text
+
+        message_text = trim_history(message_text, max(room * 6 // 10, room - estimate_tokens(memory_text)))
+        memory_text = trim_memory(memory_text, room - estimate_tokens(message_text))
+        return memory_text, message_text
+
+    def render(self, **kwargs):
+        """Renders the compiled template; None if it has never loaded."""
+        self._refresh()
+        if self._template is None:
+            return None
+        return self._template.render(**kwargs)
@@ -1,11 +1,25 @@
 from fastapi import FastAPI, Request
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
+import hashlib
+import json
 import logging
+import time
+from contextlib import aclosing
+from typing import Any
+from config import TASKS_RESPONSE_TTL, DEBUG_ENDPOINTS
+from metrics import REGISTRY, CACHE_LOOKUPS, QUEUE_DEPTH
+from profiling import profile_for, memory_top, ProfilerBusy
+import tracing
 
 # We will inject the TaskManager instance from main.py
 task_manager = None
+agent = None
+work_queue = None
+debouncer = None
+discussion_buffer = None
 notification_callback = None
 
 app = FastAPI()
@@ -19,15 +33,95 @@ app.add_middleware(
 templates = Jinja2Templates(directory="templates")
 logger = logging.getLogger(__name__)
 
+class _TaskListCache:
+    """
+    Serialized /api/tasks body with a strong ETag. Reused for `ttl` seconds while
+    task_manager.revision is unchanged (every task write bumps it, so edits show up
+    at once); concurrent misses share one load.
+    """
+
+    def __init__(self, ttl=TASKS_RESPONSE_TTL):
+        self.ttl = ttl
+        self.body = None
+        self.etag = None
+        self._key = None
+        self._expires = 0
+        self._loading = None
+        self.stats = {"hits": 0, "loads": 0, "not_modified": 0}
+
+    async def get(self):
+        key = getattr(task_manager, "revision", None)
+        if self.body is not None and key == self._key and time.monotonic() < self._expires:
+            self.stats["hits"] += 1
+            CACHE_LOOKUPS.inc(cache="tasks_response", result="hit")
+            return self.body, self.etag
+        CACHE_LOOKUPS.inc(cache="tasks_response", result="miss")
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self._load(key))
+            self._loading.add_done_callback(lambda _: setattr(self, "_loading", None))
+        return await asyncio.shield(self._loading)
+
+    async def _load(self, key):
+        self.stats["loads"] += 1
+        tasks = await task_manager.get_tasks()
+        body = json.dumps(tasks, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.body, self._key, self._expires = body, key, time.monotonic() + self.ttl
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        return self.body, self.etag
+
+task_cache = _TaskListCache()
+
+def _etag_matches(if_none_match, etag):
+    """If-None-Match uses weak comparison: W/ prefixes are ignored and * matches anything."""
+    if not if_none_match: return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or any(t.removeprefix("W/") == etag for t in tags)
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     return templates.TemplateResponse("dashboard.html", {"request": request})
 
 @app.get("/api/tasks")
-async def get_tasks():
+async def get_tasks(request: Request):
     if not task_manager:
         return []
-    return await task_manager.get_tasks()
+    body, etag = await task_cache.get()
+    # no-cache: browsers keep the body but revalidate every poll, so unchanged polls cost a 304
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        task_cache.stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/api/tasks/changes")
+async def get_task_changes(since: str):
+    """Change events after cursor `since`; `reset` means the cursor is too old and the client should reload."""
+    if not task_manager: return {}
+    changes = task_manager.changes.since(since)
+    return {"cursor": task_manager.changes.cursor, "reset": changes is None, "changes": changes or []}
+
+@app.get("/api/events")
+async def stream_events(request: Request, since: str = None):
+    """
+    Server-Sent Events stream of task/audit changes. Resumes from `since` or the
+    Last-Event-ID header that EventSource sends when it reconnects.
+    """
+    if not task_manager:
+        return JSONResponse(status_code=500, content={"error": "TaskManager not initialized"})
+    cursor = since or request.headers.get("last-event-id")
+
+    async def stream():
+        async with aclosing(task_manager.changes.subscribe(cursor)) as events: # Unsubscribes on disconnect
+            async for event in events:
+                if await request.is_disconnected():
+                    break
+                if event is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield f"id: {event['cursor']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.post("/api/done/{task_id}")
 async def mark_done(task_id: str):
@@ -60,17 +154,45 @@ async def reopen_task(task_id: str):
     await task_manager.reopen_task(task_id)
     return {"status": "success", "task": task_id}
 
+HISTORY_PAGE_SIZE = 50 # Digests read from the store per chunk of the history stream
+
+def _discussions():
+    """The listener's buffer when injected; otherwise one shared buffer opened on first use."""
+    global discussion_buffer
+    if not discussion_buffer:
+        from discussion_buffer import DiscussionBuffer
+        discussion_buffer = DiscussionBuffer(task_manager.storage if task_manager else None)
+    return discussion_buffer
+
 @app.get("/api/discussions/history")
-async def get_discussion_history():
-    from discussion_buffer import DiscussionBuffer
-    db = DiscussionBuffer() # It loads from disk, so fresh instance is fine or can inject
-    return db.get_history()
+async def get_discussion_history(before: int = None, limit: int = None):
+    """
+    Archived digests newest first, streamed as a JSON array page by page. Get the
+    next page with before=<id of the last entry>.
+    """
+    buffer = _discussions()
+
+    async def stream():
+        cursor, remaining, separator = before, limit, ""
+        yield "["
+        while remaining is None or remaining > 0:
+            size = HISTORY_PAGE_SIZE if remaining is None else min(HISTORY_PAGE_SIZE, remaining)
+            page = await buffer.get_history(before_id=cursor, limit=size)
+            for entry in page:
+                yield separator + json.dumps(entry, ensure_ascii=False)
+                separator = ","
+            if len(page) < size:
+                break
+            cursor = page[-1]["id"]
+            if remaining is not None:
+                remaining -= len(page)
+        yield "]"
+
+    return StreamingResponse(stream(), media_type="application/json")
 
 @app.get("/api/discussions/today")
 async def get_today_discussion():
-    from discussion_buffer import DiscussionBuffer
-    db = DiscussionBuffer()
-    return db.get_grouped_text() or "No discussions yet."
+    return await _discussions().get_grouped_text() or "No discussions yet."
 
 from pydantic import BaseModel
 class CommentRequest(BaseModel):
@@ -118,10 +240,75 @@ async def update_priority(task_id: str, request: dict):
     return JSONResponse(status_code=500, content={"error": "Failed to update priority"})
 
 
+@app.get("/api/notion/queue")
+async def get_notion_queue():
+    """Write-behind queue depth and counters."""
+    if not task_manager: return {}
+    return task_manager.notion_sync.write_queue.stats()
+
+@app.get("/api/listener/queue")
+async def get_listener_queue():
+    """Message-handling queue depth, wait times and shed counts (plus burst coalescing)."""
+    if not work_queue: return {}
+    stats = work_queue.stats()
+    if debouncer: stats["debounce"] = {**debouncer.stats, "pending": debouncer.pending}
+    return stats
+
+@app.get("/api/agent/stats")
+async def get_agent_stats():
+    """LLM batching and analysis-cache counters."""
+    if not agent or not agent.api_key: return {}
+    return agent.get_stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Pipeline stage latencies, LLM/Notion calls, cache hits and errors in Prometheus text format."""
+    if work_queue: QUEUE_DEPTH.set(work_queue.depth, queue="handler")
+    if debouncer: QUEUE_DEPTH.set(debouncer.pending, queue="debounce")
+    if task_manager: QUEUE_DEPTH.set(task_manager.notion_sync.write_queue.depth, queue="notion_write")
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+PROFILE_SORT_KEYS = {"cumulative", "tottime", "calls", "ncalls"}
+
+@app.get("/api/debug/traces")
+async def get_traces(limit: int = 50, min_ms: float = 0, trace_id: str = None):
+    """
+    Recent message traces, newest first, as waterfall data: each span has its parent,
+    start offset and duration (ms from the start of the trace). Filter slow ones with min_ms.
+    """
+    return tracing.get_traces(limit=limit, min_ms=min_ms, trace_id=trace_id)
+
+def _debug_disabled():
+    return JSONResponse(status_code=404, content={"error": "Debug endpoints are disabled (set DEBUG_ENDPOINTS=true)"})
+
+@app.get("/api/debug/profile")
+async def debug_profile(seconds: float = 10, limit: int = 40, sort: str = "cumulative"):
+    """cProfile of the event loop for `seconds` (max 60), top functions as text. Opt-in via DEBUG_ENDPOINTS."""
+    if not DEBUG_ENDPOINTS: return _debug_disabled()
+    if sort not in PROFILE_SORT_KEYS:
+        return JSONResponse(status_code=400, content={"error": f"sort must be one of {sorted(PROFILE_SORT_KEYS)}"})
+    try:
+        return PlainTextResponse(await profile_for(seconds, limit=limit, sort=sort))
+    except ProfilerBusy as e:
+        return JSONResponse(status_code=409, content={"error": str(e)})
+
+@app.get("/api/debug/memory")
+async def debug_memory(seconds: float = 10, limit: int = 25):
+    """tracemalloc top allocation sites (growth over `seconds` unless already tracing). Opt-in via DEBUG_ENDPOINTS."""
+    if not DEBUG_ENDPOINTS: return _debug_disabled()
+    try:
+        return await memory_top(seconds, limit=limit)
+    except ProfilerBusy as e:
+        return JSONResponse(status_code=409, content={"error": str(e)})
+
 @app.get("/api/audit")
-async def get_audit_log():
+async def get_audit_log(limit: int = 100, before_id: int = None, since: str = None, until: str = None,
+                        sender: str = None, priority: int = None):
+    """Audit entries newest first. Page with before_id=<last id>; filter by time range, sender or priority."""
     if not task_manager: return []
-    return await task_manager.get_audit_log()
+    return await task_manager.get_audit_log(
+        limit=limit, before_id=before_id, since=since, until=until, sender=sender, priority=priority
+    )
 
 class CreateTaskRequest(BaseModel):
     summary: str
@@ -130,6 +317,28 @@ class CreateTaskRequest(BaseModel):
     link: str = None
     deadline: str = None
 
+class BulkOperation(BaseModel):
+    id: str
+    action: str # done, reject, reopen or priority
+    priority: Any = None # Checked per operation, so one bad value is that item's "invalid_priority", not a 422 for the batch
+
+@app.post("/api/tasks/bulk")
+async def bulk_update(operations: list[BulkOperation]):
+    """Applies many task operations in one request; returns a result per operation."""
+    if not task_manager:
+        return JSONResponse(status_code=500, content={"error": "TaskManager not initialized"})
+
+    try:
+        results = await task_manager.bulk_update([op.model_dump() for op in operations])
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    succeeded = sum(1 for r in results if r["ok"])
+    done = sum(1 for r in results if r["ok"] and r["action"] == "done")
+    if notification_callback and done:
+        await notification_callback(f"{done} tasks marked as Done")
+    return {"results": results, "succeeded": succeeded, "failed": len(results) - succeeded}
+
 @app.post("/api/tasks/create")
 async def create_task_manual(request: CreateTaskRequest):
     if not task_manager:
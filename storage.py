@@ -0,0 +1,600 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from config import AUDIT_RETENTION_DAYS, AUDIT_MAX_ENTRIES, STORAGE_BATCH_MS, STORAGE_BATCH_SIZE
+from persistence import run_io, submit_io
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+DB_FILE = "agent.db"
+LEGACY_AUDIT_FILE = "audit_log.json"
+PRUNE_EVERY = 100 # Inserts between retention sweeps
+MAX_PAGE_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS audit (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    sender TEXT,
+    priority INTEGER,
+    text TEXT,
+    evaluation TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS audit_timestamp ON audit(timestamp);
+CREATE INDEX IF NOT EXISTS audit_sender ON audit(sender, id);
+CREATE INDEX IF NOT EXISTS audit_priority ON audit(priority, id);
+
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    priority INTEGER,
+    summary TEXT,
+    sender TEXT,
+    link TEXT,
+    deadline TEXT,
+    comments TEXT NOT NULL DEFAULT '[]',
+    notion_page_id TEXT,
+    last_edited_time TEXT,
+    sync_error TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_seq ON tasks(seq);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks(status, seq);
+CREATE INDEX IF NOT EXISTS tasks_priority ON tasks(priority);
+CREATE INDEX IF NOT EXISTS tasks_link ON tasks(link);
+
+CREATE TABLE IF NOT EXISTS comments (
+    id TEXT PRIMARY KEY,
+    task_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    sender TEXT,
+    text TEXT,
+    block_id TEXT
+);
+CREATE INDEX IF NOT EXISTS comments_task ON comments(task_id, timestamp);
+
+CREATE TABLE IF NOT EXISTS comment_sync (
+    task_id TEXT PRIMARY KEY,
+    read_at REAL
+);
+
+CREATE TABLE IF NOT EXISTS discussion_points (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    chat TEXT NOT NULL,
+    sender TEXT,
+    summary TEXT
+);
+CREATE INDEX IF NOT EXISTS discussion_points_chat ON discussion_points(chat, id);
+CREATE INDEX IF NOT EXISTS discussion_points_timestamp ON discussion_points(timestamp);
+
+CREATE TABLE IF NOT EXISTS discussion_rollups (
+    chat TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    upto_id INTEGER NOT NULL,
+    timestamp TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS daily_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    summary_text TEXT,
+    point_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS daily_history_date ON daily_history(date);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+AUDIT_INSERT = "INSERT INTO audit (timestamp, sender, priority, text, evaluation) VALUES (?, ?, ?, ?, ?)"
+POINT_INSERT = "INSERT INTO discussion_points (timestamp, chat, sender, summary) VALUES (?, ?, ?, ?)"
+
+TASK_COLUMNS = ("id", "seq", "status", "priority", "summary", "sender", "link", "deadline",
+                "comments", "notion_page_id", "last_edited_time", "sync_error")
+SYNCED_COLUMNS = TASK_COLUMNS[2:-1] # Mirrored from Notion (everything but the key, local order and sync state)
+
+class Storage:
+    """
+    Local SQLite store (WAL mode) for tasks, the audit log, discussion points and
+    digest history. Tasks are the local copy that every read is served from; Notion is
+    a mirror kept in sync by TaskManager. `seq` orders tasks by their latest write
+    (local or synced), newest highest. Comments live in their own table (one insert
+    each); a task's `comments` column only holds legacy comments parsed from the
+    Notion AgentComments property, and reads return both merged. `comment_sync` records
+    when each task's comment blocks were last read back from Notion. `sync_error` flags a
+    task whose local changes Notion never accepted; it clears when Notion's copy is
+    merged again. Audit entries older than `retention_days` or beyond `max_audit` are
+    pruned periodically.
+
+    Methods are blocking; coroutines call them through `run()` (or `call_soon()`),
+    which executes them on the shared disk I/O thread. Append-only inserts (audit,
+    discussion points) go through `queue_write()` and are committed in batches.
+    """
+
+    def __init__(self, path=DB_FILE, retention_days=AUDIT_RETENTION_DAYS, max_audit=AUDIT_MAX_ENTRIES):
+        self.path = path
+        self.retention_days = retention_days
+        self.max_audit = max_audit
+        self._db = None
+        self._audit_writes = 0
+        self._seq = None
+        self._batch = [] # (sql, params) waiting to be committed together
+        self._flush_timer = None
+
+    def _conn(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False) # Used from the I/O thread
+            self._db.row_factory = sqlite3.Row
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL") # Durable at checkpoints; WAL keeps it consistent
+            self._db.executescript(SCHEMA)
+            self._migrate_columns()
+            self._migrate_legacy_audit()
+        return self._db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    # --- Async access ---
+
+    async def run(self, fn, *args, **kwargs):
+        """Runs a storage method on the I/O thread, after any buffered writes."""
+        self.flush_writes()
+        with span(f"storage.{fn.__name__}"):
+            return await run_io(fn, *args, **kwargs)
+
+    def call_soon(self, fn, *args, **kwargs):
+        """Queues a storage method on the I/O thread without waiting for it."""
+        self.flush_writes()
+        return submit_io(fn, *args, **kwargs)
+
+    async def aclose(self):
+        self.flush_writes()
+        await run_io(self.close)
+
+    def queue_write(self, sql, params):
+        """Buffers an insert; buffered inserts are committed in one transaction on the I/O thread."""
+        self._batch.append((sql, params))
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_batch(self._take_batch()) # No loop (scripts, startup): write inline
+            return
+        if len(self._batch) >= STORAGE_BATCH_SIZE:
+            self.flush_writes()
+        elif self._flush_timer is None:
+            self._flush_timer = loop.call_later(STORAGE_BATCH_MS / 1000, self.flush_writes)
+
+    def _take_batch(self):
+        if self._flush_timer:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        batch, self._batch = self._batch, []
+        return batch
+
+    def flush_writes(self):
+        """Hands buffered inserts to the I/O thread."""
+        batch = self._take_batch()
+        if batch:
+            submit_io(self._write_batch, batch)
+
+    def _write_batch(self, batch):
+        db = self._conn()
+        with db:
+            for sql, params in batch:
+                db.execute(sql, params)
+        audits = sum(1 for sql, _ in batch if sql is AUDIT_INSERT)
+        if audits:
+            before = self._audit_writes
+            self._audit_writes += audits
+            if self._audit_writes // PRUNE_EVERY != before // PRUNE_EVERY:
+                self.prune_audit()
+
+    # --- Meta ---
+
+    def get_meta(self, key, default=None):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else default
+
+    def set_meta(self, key, value):
+        db = self._conn()
+        with db:
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    # --- Tasks ---
+
+    def _next_seq(self):
+        if self._seq is None:
+            self._seq = self._conn().execute("SELECT COALESCE(MAX(seq), 0) FROM tasks").fetchone()[0]
+        self._seq += 1
+        return self._seq
+
+    def _task_row(self, task):
+        return (task["id"], self._next_seq(), *self._synced_values(task), task.get("sync_error"))
+
+    @staticmethod
+    def _synced_values(task):
+        """Values of the SYNCED_COLUMNS as they are stored for `task`."""
+        return (
+            task.get("status") or "active", task.get("priority"), task.get("summary"), task.get("sender"),
+            task.get("link") or "", task.get("deadline") or "",
+            json.dumps(task.get("comments") or [], ensure_ascii=False), task.get("notion_page_id"),
+            task.get("last_edited_time")
+        )
+
+    @staticmethod
+    def _task_dict(row):
+        task = {k: row[k] for k in TASK_COLUMNS if k != "seq"}
+        task["comments"] = json.loads(task["comments"])
+        return task
+
+    def upsert_tasks(self, tasks):
+        """Inserts or replaces tasks; later items become newer (pass them oldest first)."""
+        db = self._conn()
+        with db:
+            db.executemany(
+                f"INSERT OR REPLACE INTO tasks ({', '.join(TASK_COLUMNS)}) VALUES ({', '.join('?' * len(TASK_COLUMNS))})",
+                [self._task_row(t) for t in tasks]
+            )
+
+    def replace_tasks(self, tasks, keep_ids=()):
+        """Replaces every task with `tasks` (oldest first), except rows in `keep_ids`."""
+        keep_ids = set(keep_ids)
+        db = self._conn()
+        with db:
+            existing = [r["id"] for r in db.execute("SELECT id FROM tasks")]
+            db.executemany("DELETE FROM tasks WHERE id = ?", [(i,) for i in existing if i not in keep_ids])
+            db.executemany(
+                f"INSERT OR REPLACE INTO tasks ({', '.join(TASK_COLUMNS)}) VALUES ({', '.join('?' * len(TASK_COLUMNS))})",
+                [self._task_row(t) for t in tasks if t["id"] not in keep_ids]
+            )
+            # Comments are kept: they mirror Notion blocks, and the task may come back (e.g. unarchived)
+
+    def get_task(self, task_id):
+        row = self._conn().execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return self._with_comments([self._task_dict(row)])[0] if row else None
+
+    def query_tasks_by_prefix(self, prefix):
+        """Tasks whose id starts with `prefix` (e.g. provisional ids), oldest write first."""
+        rows = self._conn().execute("SELECT * FROM tasks WHERE substr(id, 1, ?) = ? ORDER BY seq", (len(prefix), prefix))
+        return self._with_comments([self._task_dict(r) for r in rows])
+
+    def task_ids(self):
+        return [r["id"] for r in self._conn().execute("SELECT id FROM tasks")]
+
+    def count_tasks(self):
+        return self._conn().execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+
+    def query_tasks(self, status=None, limit=None):
+        """Tasks most recently written first, optionally filtered by status."""
+        sql, params = "SELECT * FROM tasks", []
+        if status:
+            sql += " WHERE status = ?"; params.append(status)
+        sql += " ORDER BY seq DESC"
+        if limit:
+            sql += " LIMIT ?"; params.append(limit)
+        return self._with_comments([self._task_dict(r) for r in self._conn().execute(sql, params)])
+
+    def _apply_update(self, db, task_id, changes):
+        changes = {k: v for k, v in changes.items() if k in TASK_COLUMNS and k not in ("id", "seq")}
+        if "comments" in changes:
+            changes["comments"] = json.dumps(changes["comments"], ensure_ascii=False)
+        assignments = ", ".join(f"{k} = ?" for k in changes)
+        return db.execute(
+            f"UPDATE tasks SET {assignments + ', ' if assignments else ''}seq = ? WHERE id = ?",
+            list(changes.values()) + [self._next_seq(), task_id]
+        ).rowcount
+
+    def update_task(self, task_id, **changes):
+        """Applies changes to a task and makes it the newest; returns the task or None."""
+        db = self._conn()
+        with db:
+            updated = self._apply_update(db, task_id, changes)
+        return self.get_task(task_id) if updated else None
+
+    def update_tasks(self, updates):
+        """Applies [(task_id, changes)] in one transaction; returns {task_id: task} for the tasks that exist."""
+        db = self._conn()
+        with db:
+            updated = [task_id for task_id, changes in updates if self._apply_update(db, task_id, changes)]
+        return {task_id: self.get_task(task_id) for task_id in dict.fromkeys(updated)}
+
+    def changed_tasks(self, tasks):
+        """The tasks (in order) that are not stored yet or differ from their stored row."""
+        ids = [t["id"] for t in tasks]
+        stored = {}
+        for start in range(0, len(ids), MAX_PAGE_SIZE): # Stay under SQLite's bound-parameter limit
+            chunk = ids[start:start + MAX_PAGE_SIZE]
+            rows = self._conn().execute(
+                f"SELECT id, {', '.join(SYNCED_COLUMNS)} FROM tasks WHERE id IN ({', '.join('?' * len(chunk))})",
+                chunk
+            )
+            stored.update((r["id"], tuple(r[c] for c in SYNCED_COLUMNS)) for r in rows)
+        return [t for t in tasks if stored.get(t["id"]) != self._synced_values(t)]
+
+    def existing_task_ids(self, task_ids):
+        ids = list(task_ids)
+        rows = self._conn().execute(f"SELECT id FROM tasks WHERE id IN ({', '.join('?' * len(ids))})", ids)
+        return {r["id"] for r in rows}
+
+    def delete_task(self, task_id):
+        """Removes a task and its comments."""
+        db = self._conn()
+        with db:
+            db.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+            db.execute("DELETE FROM comments WHERE task_id = ?", (task_id,))
+
+    def set_sync_error(self, task_id, error):
+        """Flags a task as out of sync with Notion (None clears it) without moving it."""
+        db = self._conn()
+        with db:
+            db.execute("UPDATE tasks SET sync_error = ? WHERE id = ?", (error, task_id))
+
+    def rekey_task(self, old_id, new_id):
+        """Moves a task from its provisional id to the real Notion page id."""
+        db = self._conn()
+        with db:
+            db.execute("DELETE FROM tasks WHERE id = ?", (new_id,)) # A delta sync may have got there first
+            db.execute("UPDATE tasks SET id = ?, notion_page_id = ? WHERE id = ?", (new_id, new_id, old_id))
+            db.execute("UPDATE comments SET task_id = ? WHERE task_id = ?", (new_id, old_id))
+            # Its comments are all local so far
+            db.execute("INSERT OR REPLACE INTO comment_sync (task_id, read_at) VALUES (?, ?)", (new_id, time.time()))
+
+    # --- Comments ---
+
+    def _with_comments(self, tasks):
+        """Merges each task's local comments into its legacy ones, newest first."""
+        by_task = {t["id"]: t for t in tasks}
+        ids = list(by_task)
+        for start in range(0, len(ids), MAX_PAGE_SIZE): # Stay under SQLite's bound-parameter limit
+            chunk = ids[start:start + MAX_PAGE_SIZE]
+            rows = self._conn().execute(
+                f"SELECT id, task_id, timestamp, sender, text FROM comments WHERE task_id IN ({', '.join('?' * len(chunk))})",
+                chunk
+            )
+            for r in rows:
+                by_task[r["task_id"]]["comments"].append(
+                    {"id": r["id"], "timestamp": r["timestamp"], "sender": r["sender"], "text": r["text"]}
+                )
+        for task in tasks:
+            task["comments"].sort(key=lambda c: c.get("timestamp") or "", reverse=True)
+        return tasks
+
+    def add_comment(self, task_id, comment):
+        db = self._conn()
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO comments (id, task_id, timestamp, sender, text) VALUES (?, ?, ?, ?, ?)",
+                (comment["id"], task_id, comment["timestamp"], comment.get("sender"), comment.get("text"))
+            )
+
+    def get_comments(self, task_id):
+        """A task's comments newest first, or None if the task is not stored."""
+        task = self.get_task(task_id)
+        return task["comments"] if task else None
+
+    def find_comment(self, task_id, comment_id):
+        """Returns {"block_id", "legacy"} for a comment of the task, or None if it has no such comment."""
+        row = self._conn().execute(
+            "SELECT block_id FROM comments WHERE id = ? AND task_id = ?", (comment_id, task_id)
+        ).fetchone()
+        if row:
+            return {"block_id": row["block_id"], "legacy": False}
+        row = self._conn().execute("SELECT comments FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        if row and any(c.get("id") == comment_id for c in json.loads(row["comments"])):
+            return {"block_id": None, "legacy": True}
+        return None
+
+    def remove_comment(self, task_id, comment_id):
+        db = self._conn()
+        with db:
+            if db.execute("DELETE FROM comments WHERE id = ? AND task_id = ?", (comment_id, task_id)).rowcount:
+                return
+            row = db.execute("SELECT comments FROM tasks WHERE id = ?", (task_id,)).fetchone()
+            if row:
+                legacy = [c for c in json.loads(row["comments"]) if c.get("id") != comment_id]
+                db.execute("UPDATE tasks SET comments = ? WHERE id = ?", (json.dumps(legacy, ensure_ascii=False), task_id))
+
+    def comments_read_at(self, task_id):
+        """Epoch time the task's comment blocks were last read from Notion, or None if never (or since it changed)."""
+        row = self._conn().execute("SELECT read_at FROM comment_sync WHERE task_id = ?", (task_id,)).fetchone()
+        return row["read_at"] if row else None
+
+    def forget_synced_comments(self, task_ids):
+        """Marks the tasks' comment blocks as due for a re-read."""
+        db = self._conn()
+        with db:
+            db.executemany("DELETE FROM comment_sync WHERE task_id = ?", [(i,) for i in task_ids])
+
+    def store_synced_comments(self, task_id, comments):
+        """
+        Mirrors comments read from a task's Notion blocks: edited ones are updated, ones whose
+        block is gone are removed (comments with no known block are kept), and the read is recorded.
+        """
+        db = self._conn()
+        with db:
+            db.executemany(
+                "INSERT INTO comments (id, task_id, timestamp, sender, text, block_id) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET timestamp = excluded.timestamp, sender = excluded.sender, "
+                "text = excluded.text, block_id = excluded.block_id",
+                [(c["id"], task_id, c["timestamp"], c.get("sender"), c.get("text"), c.get("block_id")) for c in comments]
+            )
+            blocks = [c["block_id"] for c in comments]
+            db.execute(
+                f"DELETE FROM comments WHERE task_id = ? AND block_id IS NOT NULL AND block_id NOT IN ({', '.join('?' * len(blocks))})",
+                [task_id, *blocks]
+            )
+            db.execute("INSERT OR REPLACE INTO comment_sync (task_id, read_at) VALUES (?, ?)", (task_id, time.time()))
+
+    def set_comment_blocks(self, blocks):
+        """Records the Notion block id of each mirrored comment ({comment_id: block_id})."""
+        db = self._conn()
+        with db:
+            db.executemany("UPDATE comments SET block_id = ? WHERE id = ?", [(b, c) for c, b in blocks.items()])
+
+    # --- Discussions ---
+
+    @staticmethod
+    def _point_row(point):
+        return (point["timestamp"], point["chat"], point.get("sender"), point.get("summary"))
+
+    def add_discussion_point(self, point):
+        """Inserts a point right away and returns its id."""
+        db = self._conn()
+        with db:
+            cursor = db.execute(POINT_INSERT, self._point_row(point))
+        return cursor.lastrowid
+
+    def append_discussion_point(self, point):
+        """Buffers a point for the next batched commit."""
+        self.queue_write(POINT_INSERT, self._point_row(point))
+
+    def discussion_points(self, chat=None, after_id=0, upto_id=None):
+        """Buffered points in arrival order, optionally for one chat after a point id (and up to another)."""
+        sql, params = "SELECT id, timestamp, chat, sender, summary FROM discussion_points WHERE id > ?", [after_id]
+        if chat is not None:
+            sql += " AND chat = ?"; params.append(chat)
+        if upto_id is not None:
+            sql += " AND id <= ?"; params.append(upto_id)
+        return [dict(r) for r in self._conn().execute(sql + " ORDER BY id", params)]
+
+    def count_discussion_points(self, upto_id=None):
+        if upto_id is None:
+            return self._conn().execute("SELECT COUNT(*) FROM discussion_points").fetchone()[0]
+        return self._conn().execute("SELECT COUNT(*) FROM discussion_points WHERE id <= ?", (upto_id,)).fetchone()[0]
+
+    def last_discussion_point_id(self):
+        return self._conn().execute("SELECT COALESCE(MAX(id), 0) FROM discussion_points").fetchone()[0]
+
+    def get_rollups(self):
+        rows = self._conn().execute("SELECT chat, summary, upto_id, timestamp FROM discussion_rollups")
+        return {r["chat"]: {"summary": r["summary"], "upto_id": r["upto_id"], "timestamp": r["timestamp"]} for r in rows}
+
+    def set_rollup(self, chat, summary, upto_id, timestamp):
+        db = self._conn()
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO discussion_rollups (chat, summary, upto_id, timestamp) VALUES (?, ?, ?, ?)",
+                (chat, summary, upto_id, timestamp)
+            )
+
+    def clear_discussions(self, upto_id):
+        """
+        Deletes the points up to `upto_id` and every rolling summary. Later points stay,
+        pending again (a summary covering them also covered deleted ones).
+        """
+        db = self._conn()
+        with db:
+            db.execute("DELETE FROM discussion_points WHERE id <= ?", (upto_id,))
+            db.execute("DELETE FROM discussion_rollups")
+
+    def add_history(self, entry):
+        db = self._conn()
+        with db:
+            db.execute(
+                "INSERT INTO daily_history (date, timestamp, summary_text, point_count) VALUES (?, ?, ?, ?)",
+                (entry["date"], entry["timestamp"], entry.get("summary_text"), entry.get("point_count"))
+            )
+
+    def get_history(self, before_id=None, limit=None):
+        """Archived digests, newest first. Page with `before_id` (the last id of the previous page)."""
+        sql, params = "SELECT id, date, timestamp, summary_text, point_count FROM daily_history", []
+        if before_id is not None:
+            sql += " WHERE id < ?"; params.append(before_id)
+        sql += " ORDER BY id DESC"
+        if limit:
+            sql += " LIMIT ?"; params.append(limit)
+        return [dict(r) for r in self._conn().execute(sql, params)]
+
+    # --- Audit ---
+
+    def _migrate_columns(self):
+        """Adds columns introduced after the database was created."""
+        columns = {r["name"] for r in self._db.execute("PRAGMA table_info(tasks)")}
+        if "sync_error" not in columns:
+            self._db.execute("ALTER TABLE tasks ADD COLUMN sync_error TEXT")
+        columns = {r["name"] for r in self._db.execute("PRAGMA table_info(comment_sync)")}
+        if "read_at" not in columns:
+            self._db.execute("ALTER TABLE comment_sync ADD COLUMN read_at REAL")
+
+    def _migrate_legacy_audit(self):
+        """One-time import of the old audit_log.json (newest first)."""
+        if not os.path.exists(LEGACY_AUDIT_FILE):
+            return
+        try:
+            with open(LEGACY_AUDIT_FILE, "r") as f:
+                entries = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            entries = []
+        with self._db:
+            self._db.executemany(AUDIT_INSERT, [self._audit_row(e) for e in reversed(entries)])
+        os.remove(LEGACY_AUDIT_FILE)
+        logger.info(f"Migrated {len(entries)} audit entries to {self.path}.")
+
+    @staticmethod
+    def _audit_row(entry):
+        evaluation = entry.get("evaluation") or {}
+        priority = evaluation.get("priority") if isinstance(evaluation, dict) else None
+        return (
+            entry.get("timestamp") or datetime.now().isoformat(),
+            entry.get("sender"),
+            priority if isinstance(priority, int) else None,
+            entry.get("text"),
+            json.dumps(evaluation, ensure_ascii=False)
+        )
+
+    def add_audit(self, entry):
+        """Buffers an audit entry ({timestamp, sender, text, evaluation}) for the next batched commit."""
+        self.queue_write(AUDIT_INSERT, self._audit_row(entry))
+
+    def prune_audit(self):
+        """Drops entries past the retention window, then the oldest beyond max_audit."""
+        db = self._conn()
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).isoformat()
+        with db:
+            removed = db.execute("DELETE FROM audit WHERE timestamp < ?", (cutoff,)).rowcount
+            removed += db.execute(
+                "DELETE FROM audit WHERE id IN (SELECT id FROM audit ORDER BY id DESC LIMIT -1 OFFSET ?)",
+                (self.max_audit,)
+            ).rowcount
+        if removed:
+            logger.info(f"Pruned {removed} audit entries.")
+
+    def query_audit(self, limit=100, before_id=None, since=None, until=None, sender=None, priority=None):
+        """
+        Returns audit entries newest first. Page with `before_id` (the last id of the
+        previous page); `since`/`until` are ISO timestamps.
+        """
+        clauses, params = [], []
+        if before_id is not None:
+            clauses.append("id < ?"); params.append(before_id)
+        if since:
+            clauses.append("timestamp >= ?"); params.append(since)
+        if until:
+            clauses.append("timestamp < ?"); params.append(until)
+        if sender:
+            clauses.append("sender = ?"); params.append(sender)
+        if priority is not None:
+            clauses.append("priority = ?"); params.append(priority)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(max(1, min(limit, MAX_PAGE_SIZE)))
+
+        rows = self._conn().execute(
+            f"SELECT id, timestamp, sender, text, evaluation FROM audit {where} ORDER BY id DESC LIMIT ?", params
+        ).fetchall()
+        return [
+            {"id": r["id"], "timestamp": r["timestamp"], "sender": r["sender"], "text": r["text"],
+             "evaluation": json.loads(r["evaluation"])}
+            for r in rows
+        ]
@@ -0,0 +1,169 @@
+import asyncio
+import inspect
+import logging
+from datetime import datetime, timedelta
+from agent import SUMMARY_FAILED
+from config import (
+    SUMMARY_CHUNK_TOKENS, SUMMARY_CONCURRENCY, SUMMARY_ROLLUP_POINTS, SUMMARY_ROLLUP_MINUTES
+)
+from prompts import CHARS_PER_TOKEN, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+MAX_REDUCE_LEVELS = 3 # Rounds of re-summarizing partials before the final reduce
+ROLLUP_CHECK_INTERVAL = 60 # Seconds between checks for chats due a rolling summary
+
+def chunk_lines(lines, max_tokens):
+    """Packs lines into newline-joined chunks of at most `max_tokens` (over-long lines are cut)."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks, current, size = [], [], 0
+    for line in lines:
+        line = line[:max_chars]
+        if current and size + len(line) + 1 > max_chars:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+POINTS_HEADER = "Here are the un-processed discussion points from today:"
+PARTIALS_HEADER = "Here are summaries of today's discussions, grouped by chat (long chats were summarized in parts):"
+
+def _grouped_text(grouped, header):
+    text = header + "\n\n"
+    for chat, lines in grouped.items():
+        text += f"### {chat}\n" + "\n".join(lines) + "\n\n"
+    return text
+
+class DiscussionSummarizer:
+    """
+    Map-reduce digest of the discussion buffer. Small buffers go to the model in one
+    call as before; larger ones are split per chat into `chunk_tokens` chunks that are
+    summarized concurrently (at most `concurrency` at a time, cached per chunk by the
+    agent), and the partial summaries are reduced into the final digest.
+
+    In rolling mode (`run_rolling`) chats with `rollup_points` new points, or with new
+    points older than `rollup_minutes`, are folded into a running per-chat summary
+    during the day, so the digest only has the leftover tail to add.
+    """
+
+    def __init__(self, agent, chunk_tokens=SUMMARY_CHUNK_TOKENS, concurrency=SUMMARY_CONCURRENCY,
+                 rollup_points=SUMMARY_ROLLUP_POINTS, rollup_minutes=SUMMARY_ROLLUP_MINUTES):
+        self.agent = agent
+        self.chunk_tokens = chunk_tokens
+        self.concurrency = concurrency
+        self.rollup_points = rollup_points
+        self.rollup_minutes = rollup_minutes
+        self.stats = {"rollups": 0, "rollup_failures": 0, "points_folded": 0}
+
+    async def run_rolling(self, buffer):
+        """Background loop folding new points into per-chat rolling summaries."""
+        if self.rollup_points <= 0 and self.rollup_minutes <= 0:
+            logger.info("Rolling discussion summaries disabled.")
+            return
+        logger.info("Rolling discussion summaries started.")
+        while True:
+            await asyncio.sleep(ROLLUP_CHECK_INTERVAL)
+            try:
+                await self.roll_up(buffer)
+            except Exception as e:
+                logger.error(f"Rolling summary pass failed: {e}")
+
+    def _due(self, points):
+        if self.rollup_points > 0 and len(points) >= self.rollup_points:
+            return True
+        if self.rollup_minutes > 0:
+            cutoff = datetime.now() - timedelta(minutes=self.rollup_minutes)
+            return datetime.fromisoformat(points[0]["timestamp"]) <= cutoff
+        return False
+
+    async def roll_up(self, buffer, force=False):
+        """Folds the pending points of every due chat (every chat if `force`) into its rolling summary."""
+        generation = buffer.generation
+        rollups = await buffer.get_rollups()
+        pending = await buffer.get_pending(rollups)
+        due = {chat: entry for chat, entry in pending.items() if force or self._due(entry[1])}
+        if not due:
+            return
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def fold(chat, points):
+            async with slots:
+                summary = rollups.get(chat, {}).get("summary")
+                lines = [f"- [{p['sender']}]: {p['summary']}" for p in points]
+                # Fold chunk by chunk so a long tail never overflows one prompt
+                for chunk in chunk_lines(lines, self.chunk_tokens):
+                    text = f"(Summary of earlier discussion)\n{summary}\n\nNew points:\n{chunk}" if summary else chunk
+                    summary = await self.agent.summarize_chunk(chat, text)
+                    if summary is None:
+                        self.stats["rollup_failures"] += 1
+                        return # Points stay pending; the next pass retries
+            if await buffer.set_rollup(chat, summary, points[-1]["id"], generation):
+                self.stats["rollups"] += 1
+                self.stats["points_folded"] += len(points)
+
+        await asyncio.gather(*(fold(chat, points) for chat, (_, points) in due.items()))
+        logger.info(f"Rolled up {len(due)} chats into running summaries.")
+
+    async def summarize(self, grouped, on_progress=None):
+        """
+        Summarizes {chat: [point lines]}. `on_progress(done, total)` (sync or async)
+        is called as chunks finish.
+        """
+        if not grouped:
+            return await self.agent.summarize_discussions(None)
+
+        text = _grouped_text(grouped, POINTS_HEADER)
+        if estimate_tokens(text) <= self.chunk_tokens:
+            return await self.agent.summarize_discussions(text)
+
+        partials = grouped
+        for level in range(MAX_REDUCE_LEVELS):
+            # The first round covers every chat; later rounds only merge chats still in several parts
+            todo = {chat: lines for chat, lines in partials.items() if level == 0 or len(lines) > 1}
+            if not todo:
+                break
+            summaries = await self._map(todo, on_progress)
+            if summaries is None:
+                return SUMMARY_FAILED
+            partials = {chat: summaries.get(chat, lines) for chat, lines in partials.items()}
+            text = _grouped_text(partials, PARTIALS_HEADER)
+            if estimate_tokens(text) <= self.chunk_tokens:
+                break
+
+        return await self.agent.summarize_discussions(text)
+
+    async def _map(self, grouped, on_progress):
+        """Summarizes every chunk of every chat; returns {chat: [partial summaries]} or None on any failure."""
+        jobs = [(chat, chunk) for chat, lines in grouped.items() for chunk in chunk_lines(lines, self.chunk_tokens)]
+        total = len(jobs)
+        done = 0
+        slots = asyncio.Semaphore(self.concurrency)
+        logger.info(f"Summarizing {len(grouped)} chats in {total} chunks...")
+
+        async def run(chat, chunk):
+            nonlocal done
+            async with slots:
+                summary = await self.agent.summarize_chunk(chat, chunk)
+            done += 1
+            if on_progress:
+                try:
+                    result = on_progress(done, total)
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception as e:
+                    logger.warning(f"Summary progress callback failed: {e}")
+            return summary
+
+        # Every chunk runs even if one fails, so finished parts are cached for the retry
+        summaries = await asyncio.gather(*(run(chat, chunk) for chat, chunk in jobs))
+        if any(s is None for s in summaries):
+            logger.error(f"{sum(s is None for s in summaries)} of {total} summary chunks failed.")
+            return None
+
+        results = {}
+        for (chat, _), summary in zip(jobs, summaries):
+            results.setdefault(chat, []).append(summary)
+        return results
@@ -1,16 +1,269 @@
-from datetime import datetime
+from datetime import datetime, timezone
+import asyncio
 import logging
-from notion_sync import NotionSync
+import time
+from config import TASK_CACHE_TTL, TASK_SYNC_INTERVAL, COMMENT_REFRESH_SECONDS
+from notion_sync import NotionSync, LOCAL_ID_PREFIX
+from link_index import LinkIndex
+from storage import Storage
+from change_feed import ChangeFeed
+from tracing import detach
+from metrics import stage
 
 logger = logging.getLogger(__name__)
 
+LINK_INDEX_RETRY_BASE = 60 # Seconds before retrying a failed link index build, doubled per failure
+LINK_INDEX_RETRY_MAX = 1800
+BULK_MAX_OPERATIONS = 500
+BULK_STATUS = {"done": "done", "reject": "rejected", "reopen": "active"} # Bulk action -> task status
+
+def _notion_now():
+    """Current UTC time in Notion's last_edited_time format."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
 class TaskManager:
     def __init__(self, storage_file="tasks.json"):
         # Storage file argument kept for compatibility but ignored
         self.notion_sync = NotionSync()
+
+        # Local task store (SQLite): every read is an indexed local query and Notion is a
+        # mirror, written through the write-behind queue and pulled by delta sync.
+        self.storage = Storage()
+        self.revision = 0 # Bumped on every change to the task set (lets callers cache derived views)
+        self.changes = ChangeFeed() # Per-record change events for the dashboard
+        self._cache_loaded = False
+        self._cache_lock = asyncio.Lock()
+        self._local_edits = {} # id -> monotonic time of the last local write
+        self._refresh_task = None
+        self.cache_ttl = TASK_CACHE_TTL # Full resync interval
+        self.sync_interval = TASK_SYNC_INTERVAL # Delta sync interval
+
+        # Persistent link -> page_id index so deduplication never searches Notion
+        self.link_index = LinkIndex()
+        self._link_index_lock = asyncio.Lock() # One full scan at a time, however many callers need the index
+        self._link_index_backoff = 0
+        self._link_index_retry_at = 0 # Monotonic time before which a failed build is not retried
+        self._pending_links = {} # link -> provisional id while the page waits in the write queue
+        self.notion_sync.on_page_created.append(self._on_page_created)
+        self.notion_sync.on_comment_blocks.append(self._on_comment_blocks)
+        self.notion_sync.on_write_failed.append(self._on_write_failed)
+
+    async def start_cache(self):
+        """Brings the local task store up to date and starts the background refresh."""
+        await self.ensure_link_index()
+        await self._resume_local_tasks()
+        if await self._restore_cache():
+            # Tasks survived the restart: only pull what changed in Notion meanwhile
+            await self.sync_changes()
+        else:
+            await self.refresh_cache()
+        if not self._refresh_task:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        """Pulls Notion edits every sync_interval seconds, with a full resync every cache_ttl."""
+        last_full = time.monotonic()
+        while True:
+            await asyncio.sleep(min(self.sync_interval, self.cache_ttl))
+            await self.ensure_link_index() # Retries a failed build here rather than in add_task
+            # Full resync also drops pages archived/deleted in Notion, which deltas can't see
+            if time.monotonic() - last_full >= self.cache_ttl:
+                await self.refresh_cache()
+                last_full = time.monotonic()
+            else:
+                await self.sync_changes()
+
+    async def _restore_cache(self):
+        """Resumes from the tasks and sync watermark persisted by a previous run."""
+        watermark = await self.storage.run(self.storage.get_meta, "notion_watermark")
+        count = await self.storage.run(self.storage.count_tasks)
+        if not watermark or not count:
+            return False
+        self.notion_sync.sync_watermark = watermark
+        self._cache_loaded = True
+        logger.info(f"Task store restored: {count} tasks, synced up to {watermark}.")
+        return True
+
+    async def _resume_local_tasks(self):
+        """
+        Re-queues the creates of tasks still stored under a provisional id. The write
+        queue only lives in memory, so pages left unsent at the last shutdown would
+        otherwise never be created (and their rows dropped by the next full resync).
+        """
+        tasks = await self.storage.run(self.storage.query_tasks_by_prefix, LOCAL_ID_PREFIX)
+        for task in tasks:
+            page_id = self.link_index.get(task["link"]) if task.get("link") else None
+            if page_id:
+                # Created before the restart; only the re-key was lost
+                self.notion_sync.mark_page_created(task["id"], page_id)
+                continue
+            if await self.notion_sync.create_task_page(task, local_id=task["id"]) and task.get("link"):
+                self._pending_links[task["link"]] = task["id"]
+        if tasks:
+            logger.info(f"Resumed {len(tasks)} tasks not yet created in Notion.")
+
+    def _save_watermark(self):
+        if self.notion_sync.sync_watermark:
+            self.storage.call_soon(self.storage.set_meta, "notion_watermark", self.notion_sync.sync_watermark)
+
+    async def refresh_cache(self):
+        """Reloads all tasks from Notion."""
+        async with self._cache_lock:
+            await self._reload_cache()
+
+    async def sync_changes(self):
+        """Merges only the tasks edited in Notion since the last sync into the cache."""
+        async with self._cache_lock:
+            if not self._cache_loaded:
+                await self._reload_cache()
+                return
+
+            started = time.monotonic()
+            try:
+                changes = await self.notion_sync.fetch_changes()
+            except Exception as e:
+                logger.error(f"Task delta sync failed: {e}")
+                return
+
+            # Oldest change first, so the newest ends up newest locally too
+            merged = [t for t in reversed(changes) if not self._is_dirty(t["id"], started)]
+            if merged:
+                # Pages re-read from the watermark minute come back unchanged: skip them so they
+                # don't bump the revision, move in the list or get republished
+                merged = await self.storage.run(self.storage.changed_tasks, merged)
+            if merged:
+                await self.storage.run(self.storage.upsert_tasks, merged)
+                self.revision += 1
+                for task in merged:
+                    self.changes.publish("task_updated", task=task)
+            self._save_watermark()
+            self._index_links(changes)
+            if merged:
+                # The pages changed in Notion, maybe their comment blocks too: re-read when next opened
+                self.storage.call_soon(self.storage.forget_synced_comments, [t["id"] for t in merged])
+                logger.info(f"Task delta sync merged {len(merged)} changed tasks.")
+
+    async def _ensure_cache(self):
+        """Lazily fills the cache for callers that run before start_cache()."""
+        if self._cache_loaded: return
+        async with self._cache_lock:
+            if not self._cache_loaded:
+                await self._reload_cache()
+
+    async def _reload_cache(self):
+        """Replaces the cache with a fresh snapshot, keeping local writes made while the fetch was in flight."""
+        started = time.monotonic()
+        try:
+            tasks = await self.notion_sync.fetch_tasks()
+        except Exception as e:
+            # Keep serving the stale cache rather than dropping it on a transient error
+            logger.error(f"Task cache refresh failed: {e}")
+            return
+
+        # Local writes newer than the snapshot (including tasks not created in Notion yet) are kept
+        dirty = [task_id for task_id in await self.storage.run(self.storage.task_ids) if self._is_dirty(task_id, started)]
+        await self.storage.run(self.storage.replace_tasks, list(reversed(tasks)), keep_ids=dirty)
+        self.revision += 1
+        self.changes.publish("reset") # Full snapshot may drop tasks: clients reload
+        self._save_watermark()
+
+        self._local_edits = {k: v for k, v in self._local_edits.items() if v > started}
+        self._cache_loaded = True
+        logger.info(f"Task store refreshed: {len(tasks)} tasks from Notion.")
+        self._index_links(tasks)
+
+    def _is_dirty(self, task_id, started):
+        """True if the cached copy is newer than a Notion snapshot taken at `started`."""
+        return self._local_edits.get(task_id, 0) > started or self.notion_sync.write_queue.has_pending(task_id)
+
+    def _on_page_created(self, local_id, page_id):
+        """Re-keys a task from its provisional id to the real Notion page id, keeping its position."""
+        self.storage.call_soon(self.storage.rekey_task, local_id, page_id)
+        self.revision += 1
+        self.changes.publish("task_rekeyed", id=local_id, new_id=page_id)
+        if local_id in self._local_edits:
+            self._local_edits[page_id] = self._local_edits.pop(local_id)
+
+        for link, pending_id in list(self._pending_links.items()):
+            if pending_id == local_id:
+                del self._pending_links[link]
+                self.link_index.add(link, page_id)
+
+    def _on_write_failed(self, key, entry):
+        """
+        A queued Notion write was dropped after retries. A page that was never created
+        is removed locally (its link can be filed again); a failed update leaves the
+        task flagged as out of sync instead of silently keeping the local values.
+        """
+        if entry.create is not None:
+            for link, pending_id in list(self._pending_links.items()):
+                if pending_id == key:
+                    del self._pending_links[link]
+            self._local_edits.pop(key, None)
+            self.storage.call_soon(self.storage.delete_task, key)
+            self.revision += 1
+            self.changes.publish("task_removed", id=key, error=entry.error)
+            logger.warning(f"Removed task {key}: it could not be created in Notion ({entry.error}).")
+            return
+
+        task_id = self.notion_sync.resolve_id(key)
+        self.storage.call_soon(self.storage.set_sync_error, task_id, entry.error)
+        self.revision += 1
+        self.changes.publish("task_sync_failed", id=task_id, error=entry.error)
+
+    def _on_comment_blocks(self, page_id, blocks):
+        """Remembers which Notion block mirrors each comment, so deleting it is one request."""
+        self.storage.call_soon(self.storage.set_comment_blocks, blocks)
+
+    def _index_links(self, tasks):
+        """Adds links of tasks created outside the agent (e.g. directly in Notion) to the link index."""
+        if not self.link_index.loaded: return
+        for task in tasks:
+            if task.get("link") and task["link"] not in self.link_index:
+                self.link_index.add(task["link"], task["id"])
+
+    def _link_index_waiting(self):
+        return self.link_index.loaded or time.monotonic() < self._link_index_retry_at
+
+    async def ensure_link_index(self):
+        """
+        Loads the link index from disk, or builds it with one full paginated Notion scan.
+        After a failed build, callers return at once until an exponential backoff expires,
+        so add_task never waits on a scan that keeps failing.
+        """
+        if self._link_index_waiting(): return
+        async with self._link_index_lock:
+            if self._link_index_waiting(): return # Built (or failed) in a concurrent caller meanwhile
+            try:
+                if await self.link_index.load(): return
+            except Exception as e:
+                logger.error(f"Failed to load link index, rebuilding: {e}")
+
+            try:
+                await self.link_index.rebuild(await self.notion_sync.scan_links())
+            except Exception as e:
+                # Left unloaded (and not written to disk); dedup meanwhile only sees links added in memory
+                self._link_index_backoff = min(LINK_INDEX_RETRY_MAX, self._link_index_backoff * 2 or LINK_INDEX_RETRY_BASE)
+                self._link_index_retry_at = time.monotonic() + self._link_index_backoff
+                logger.error(f"Failed to build link index from Notion (retrying in {self._link_index_backoff}s): {e}")
+                return
+            self._link_index_backoff = 0
+
+    async def _touch(self, task_id, event="task_updated", detail=None, **changes):
+        """
+        Applies a local change to a stored task and moves it to the newest position,
+        then publishes `event` with the updated task (plus `detail`) to the change feed.
+        """
+        task_id = self.notion_sync.resolve_id(task_id)
+        self._local_edits[task_id] = time.monotonic() # Before the write, so a concurrent sync skips it
+        task = await self.storage.run(self.storage.update_task, task_id, last_edited_time=_notion_now(), **changes)
+        self.revision += 1
+        if task:
+            self.changes.publish(event, task=task, **(detail or {}))
+        return task
         
     async def add_task(self, priority: int, summary: str, sender: str, link: str, deadline: str = None, user_id: int = None):
-        """Adds a new task directly to Notion."""
+        """Adds a new task to the cache and queues it for Notion."""
         logger.info(f"Adding task to Notion: {summary}")
         
         task_data = {
@@ -22,9 +275,12 @@ class TaskManager:
             "deadline": deadline # NotionSync needs to handle this if property exists
         }
         
-        # Check if task already exists (Deduplication)
+        # Check if task already exists (Deduplication) using the local link index
         if link:
-            existing_id = await self.notion_sync.find_task_by_link(link)
+            with stage("dedupe"):
+                await self.ensure_link_index()
+                # A page for this link may still be waiting in the write queue
+                existing_id = self.link_index.get(link) or self._pending_links.get(link)
             if existing_id:
                 logger.info(f"Task already exists in Notion (ID: {existing_id}). Skipping addition.")
                 return {
@@ -35,7 +291,29 @@ class TaskManager:
                     "is_new": False
                 }
 
+        # Returns a provisional id at once; _on_page_created swaps in the real one
         page_id = await self.notion_sync.create_task_page(task_data)
+
+        if page_id:
+            if link:
+                self._pending_links[link] = page_id
+            task = {
+                "id": page_id,
+                "summary": summary,
+                "status": "active",
+                "priority": priority,
+                "sender": sender,
+                "link": link or "",
+                "deadline": deadline or "",
+                "comments": [],
+                "notion_page_id": page_id,
+                "last_edited_time": _notion_now()
+            }
+            # Published before the insert is awaited, so a create that fails at once is reported after it
+            self._local_edits[page_id] = time.monotonic()
+            self.revision += 1
+            self.changes.publish("task_added", task=task)
+            await self.storage.run(self.storage.upsert_tasks, [task])
         
         # Return a mock task object for immediate UI feedback if needed, 
         # though the dashboard should re-fetch.
@@ -50,46 +328,61 @@ class TaskManager:
     async def mark_done(self, task_id: str):
         """Updates Notion status to Done."""
         logger.info(f"Marking task done: {task_id}")
-        await self.notion_sync.update_task_status(task_id, 'done')
+        if await self.notion_sync.update_task_status(task_id, 'done'):
+            await self._touch(task_id, status="done")
 
     async def reject_task(self, task_id: str):
         """Updates Notion status to Rejected."""
         logger.info(f"Marking task rejected: {task_id}")
-        await self.notion_sync.update_task_status(task_id, 'rejected')
+        if await self.notion_sync.update_task_status(task_id, 'rejected'):
+            await self._touch(task_id, status="rejected")
 
     async def reopen_task(self, task_id: str):
         """Updates Notion status to Active."""
         logger.info(f"Reopening task: {task_id}")
-        await self.notion_sync.update_task_status(task_id, 'active')
+        if await self.notion_sync.update_task_status(task_id, 'active'):
+            await self._touch(task_id, status="active")
 
     async def get_tasks(self):
-        """Fetches tasks directly from Notion."""
-        return await self.notion_sync.get_tasks()
+        """Returns all tasks from the local store, most recently edited first."""
+        await self._ensure_cache()
+        return await self.storage.run(self.storage.query_tasks)
+
+    async def iter_tasks(self):
+        """
+        Yields tasks most recently edited first. Served from the local store when it is
+        synced; otherwise streamed from Notion page by page so callers can start before the full load.
+        """
+        if self._cache_loaded:
+            for task in await self.storage.run(self.storage.query_tasks):
+                yield task
+            return
+
+        try:
+            async for task in self.notion_sync.stream_tasks():
+                yield task
+        except Exception as e:
+            logger.error(f"Failed to stream tasks from Notion: {e}")
 
     async def get_recent_done_tasks(self, limit: int = 5):
-        """Returns most recently completed tasks from Notion."""
-        all_tasks = await self.get_tasks()
-        done_tasks = [t for t in all_tasks if t.get("status") == "done"]
-        # Notion returns unsorted or sorted by priority? We requested sort by priority.
-        # Ideally we sort by updated time but for now just slice.
-        return done_tasks[:limit]
+        """Returns most recently completed tasks (indexed by status, newest edit first)."""
+        await self._ensure_cache()
+        return await self.storage.run(self.storage.query_tasks, status="done", limit=limit)
 
     async def get_preference_examples(self, limit: int = 5):
         """Returns lists of recent accepted vs rejected tasks for AI learning."""
-        all_tasks = await self.get_tasks()
-        accepted = [{
-            "summary": t['summary'], 
-            "sender": t.get("sender", "Unknown"),
-            "priority": t.get("priority", 3),
-            "comments": [c['text'] for c in t.get("comments", [])]
-        } for t in all_tasks if t.get("status") == "done"][:limit]
-        
-        rejected = [{
-            "summary": t['summary'], 
-            "sender": t.get("sender", "Unknown"),
-            "priority": t.get("priority", 3),
-            "comments": [c['text'] for c in t.get("comments", [])]
-        } for t in all_tasks if t.get("status") == "rejected"][:limit]
+        await self._ensure_cache()
+
+        def example(t):
+            return {
+                "summary": t['summary'],
+                "sender": t.get("sender") or "Unknown",
+                "priority": t.get("priority", 3),
+                "comments": [c['text'] for c in t.get("comments", [])]
+            }
+
+        accepted = [example(t) for t in await self.storage.run(self.storage.query_tasks, status="done", limit=limit)]
+        rejected = [example(t) for t in await self.storage.run(self.storage.query_tasks, status="rejected", limit=limit)]
         return {
             "accepted": accepted,
             "rejected": rejected
@@ -98,8 +391,7 @@ class TaskManager:
 
     async def get_daily_briefing_tasks(self):
         """Returns top priority tasks for daily digest."""
-        all_tasks = await self.get_tasks()
-        active_tasks = [t for t in all_tasks if t.get("status") == "active"]
+        active_tasks = [t async for t in self.iter_tasks() if t.get("status") == "active"]
         
         # Already sorted by priority in Notion query, but let's ensure
         sorted_tasks = sorted(active_tasks, key=lambda x: x.get("priority", 0), reverse=True)
@@ -114,53 +406,136 @@ class TaskManager:
         }
 
     async def add_comment(self, task_id, text, sender):
-        """Adds a comment to a task."""
-        return await self.notion_sync.add_comment(task_id, text, sender)
+        """Adds a comment to a task: one local insert, mirrored to Notion as one appended block."""
+        task_id = self.notion_sync.resolve_id(task_id)
+        comment = await self.notion_sync.add_comment(task_id, text, sender)
+        if comment:
+            await self.storage.run(self.storage.add_comment, task_id, comment)
+            await self._touch(task_id, "comment_added", {"comment": comment})
+        return comment
 
     async def get_comments(self, task_id):
-        """Fetches comments for a task."""
-        return await self.notion_sync.get_comments(task_id)
+        """
+        Returns comments for a task from the local store, falling back to Notion.
+
+        Comments are written to Notion as page blocks, which searches don't return, so a
+        task's blocks are read here, when its comments are requested, rather than for every
+        synced task: on the first request, again once the page has changed in a delta sync,
+        and again when the last read is older than COMMENT_REFRESH_SECONDS (editing a block
+        does not always move the page's last_edited_time). Tasks nobody opens cost no requests.
+        """
+        task_id = self.notion_sync.resolve_id(task_id)
+        comments = await self.storage.run(self.storage.get_comments, task_id)
+        if comments is None:
+            return await self.notion_sync.get_comments(task_id)
+        if await self._comments_due(task_id):
+            try:
+                blocks = await self.notion_sync.fetch_comment_blocks(task_id)
+            except Exception as e:
+                logger.warning(f"Failed to read comment blocks of {task_id} from Notion: {e}")
+                return comments # Stays due, so the next request retries
+            await self.storage.run(self.storage.store_synced_comments, task_id, blocks)
+            fresh = await self.storage.run(self.storage.get_comments, task_id)
+            if fresh is not None and fresh != comments:
+                comments = fresh
+                self.revision += 1
+                # Not a task_updated: the task keeps its place in the list
+                self.changes.publish("task_comments", id=task_id, comments=comments)
+        return comments
+
+    async def _comments_due(self, task_id):
+        """True if the task's comment blocks should be (re-)read from Notion now."""
+        if not self.notion_sync.token or task_id.startswith(LOCAL_ID_PREFIX):
+            return False
+        if self.notion_sync.write_queue.has_pending(task_id):
+            return False # Queued comment changes would be undone; read it next time
+        read_at = await self.storage.run(self.storage.comments_read_at, task_id)
+        return read_at is None or time.time() - read_at >= COMMENT_REFRESH_SECONDS
 
     async def delete_comment(self, task_id, comment_id):
         """Deletes a comment from a task."""
-        return await self.notion_sync.delete_comment(task_id, comment_id)
+        task_id = self.notion_sync.resolve_id(task_id)
+        found = await self.storage.run(self.storage.find_comment, task_id, comment_id)
+        if not found:
+            logger.warning(f"Comment {comment_id} not found.")
+            return False
+
+        success = await self.notion_sync.delete_comment(task_id, comment_id, **found)
+        if success:
+            await self.storage.run(self.storage.remove_comment, task_id, comment_id)
+            await self._touch(task_id, "comment_deleted", {"comment_id": comment_id})
+        return success
 
     async def update_priority(self, task_id, priority):
         """Updates the priority of a task."""
-        return await self.notion_sync.update_task_priority(task_id, priority)
+        success = await self.notion_sync.update_task_priority(task_id, priority)
+        if success:
+            await self._touch(task_id, priority=int(priority))
+        return success
+
+    async def bulk_update(self, operations):
+        """
+        Applies [{"id", "action", "priority"?}] (actions: done, reject, reopen, priority)
+        to the local store in one transaction and queues the Notion writes, which the
+        write-behind workers send concurrently under the shared rate limit. Returns one
+        {"id", "action", "ok", "error"?} result per operation.
+        """
+        if len(operations) > BULK_MAX_OPERATIONS:
+            raise ValueError(f"At most {BULK_MAX_OPERATIONS} operations per request")
+
+        resolved = [self.notion_sync.resolve_id(op.get("id") or "") for op in operations]
+        existing = await self.storage.run(self.storage.existing_task_ids, resolved)
+        results, updates = [], []
+        for op, task_id in zip(operations, resolved):
+            action = op.get("action")
+            result = {"id": op.get("id"), "action": action, "ok": False}
+            results.append(result)
+            if task_id not in existing:
+                result["error"] = "not_found"
+                continue
+
+            if action in BULK_STATUS:
+                changes = {"status": BULK_STATUS[action]}
+                queued = await self.notion_sync.update_task_status(task_id, changes["status"])
+            elif action == "priority":
+                try:
+                    changes = {"priority": int(op.get("priority"))}
+                except (TypeError, ValueError):
+                    result["error"] = "invalid_priority"
+                    continue
+                queued = await self.notion_sync.update_task_priority(task_id, changes["priority"])
+            else:
+                result["error"] = "unknown_action"
+                continue
+
+            if not queued:
+                result["error"] = "notion_unavailable"
+                continue
+            self._local_edits[task_id] = time.monotonic() # Before the write, so a concurrent sync skips it
+            updates.append((task_id, {**changes, "last_edited_time": _notion_now()}))
+            result["ok"] = True
+
+        if updates:
+            tasks = await self.storage.run(self.storage.update_tasks, updates)
+            self.revision += 1
+            self.changes.publish("tasks_updated", tasks=list(tasks.values())) # One event, so clients re-render once
+        logger.info(f"Bulk update: {len(updates)} of {len(operations)} operations applied.")
+        return results
 
     async def log_audit(self, message_data, evaluation):
-        """Logs an AI evaluation to a local JSON file for auditing."""
-        import json
-        
+        """Logs an AI evaluation to the local audit store."""
         entry = {
             "timestamp": datetime.now().isoformat(),
             "sender": message_data.get("sender"),
             "text": message_data.get("text"),
             "evaluation": evaluation
         }
-        
-        # Load existing log
-        log_file = "audit_log.json"
-        try:
-            with open(log_file, 'r') as f:
-                logs = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            logs = []
-            
-        logs.insert(0, entry)
-        # Keep last 500 entries
-        logs = logs[:500]
-        
-        with open(log_file, 'w') as f:
-            json.dump(logs, f, indent=2)
+        self.storage.add_audit(entry)
+        self.changes.publish("audit", entry=entry)
 
-    async def get_audit_log(self, limit=100):
-        """Returns the audit log."""
-        import json
-        try:
-            with open("audit_log.json", 'r') as f:
-                logs = json.load(f)
-                return logs[:limit]
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+    async def get_audit_log(self, limit=100, before_id=None, since=None, until=None, sender=None, priority=None):
+        """Returns audit entries newest first, optionally paged and filtered."""
+        return await self.storage.run(
+            self.storage.query_audit,
+            limit=limit, before_id=before_id, since=since, until=until, sender=sender, priority=priority
+        )
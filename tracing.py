@@ -0,0 +1,151 @@
+import contextvars
+import itertools
+import logging
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from config import TRACE_BUFFER_SIZE
+
+logger = logging.getLogger(__name__)
+
+MAX_SPANS = 500 # Per trace; later spans are counted but not kept
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+_current_span = contextvars.ContextVar("span", default=None)
+
+class Trace:
+    """One message's timeline: spans with offsets from the trace start (ms), parents and attributes."""
+
+    def __init__(self, name, **attrs):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.started_at = datetime.now().isoformat()
+        self.start = time.perf_counter()
+        self.duration_ms = None
+        self.error = None
+        self.spans = []
+        self.dropped = 0
+        self._ids = itertools.count(1)
+
+    def _offset_ms(self, t):
+        return round((t - self.start) * 1000, 2)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "attrs": self.attrs,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "error": self.error,
+            "spans": self.spans,
+            "dropped_spans": self.dropped
+        }
+
+# Finished traces, newest last
+traces = deque(maxlen=max(1, TRACE_BUFFER_SIZE))
+
+def current_trace_id():
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+@contextmanager
+def start_trace(name, **attrs):
+    """Records everything run inside the block (including awaited calls) as one trace."""
+    if TRACE_BUFFER_SIZE <= 0:
+        yield None
+        return
+    trace = Trace(name, **attrs)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.error = type(e).__name__
+        raise
+    finally:
+        trace.duration_ms = trace._offset_ms(time.perf_counter())
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        traces.append(trace)
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Times a block as a span of the current trace (a no-op outside one). The yielded
+    dict can take attributes known only at the end of the block.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield attrs
+        return
+    if len(trace.spans) >= MAX_SPANS:
+        trace.dropped += 1
+        yield attrs
+        return
+
+    record = {"id": next(trace._ids), "parent": _current_span.get(), "name": name,
+              "start_ms": trace._offset_ms(time.perf_counter()), "duration_ms": None, "attrs": attrs}
+    trace.spans.append(record)
+    token = _current_span.set(record["id"])
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        _current_span.reset(token)
+
+def current():
+    """The calling task's (trace, span id), for work later done on its behalf elsewhere (see linked_span)."""
+    return _current_trace.get(), _current_span.get()
+
+@contextmanager
+def linked_span(parents, name, **attrs):
+    """
+    Times a block run on behalf of several traces (one batched request serving many
+    messages) and records it as a span in each of them, under the span each parent
+    was in. `parents` are current() results; spans share a `link` id to tie them together.
+    """
+    parents = [(trace, parent) for trace, parent in parents if trace is not None]
+    attrs["link"] = uuid.uuid4().hex[:8]
+    start = time.perf_counter()
+    error = None
+    try:
+        yield attrs
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration_ms = round((time.perf_counter() - start) * 1000, 2)
+        for trace, parent in parents:
+            if len(trace.spans) >= MAX_SPANS:
+                trace.dropped += 1
+                continue
+            record = {"id": next(trace._ids), "parent": parent, "name": name,
+                      "start_ms": trace._offset_ms(start), "duration_ms": duration_ms, "attrs": dict(attrs)}
+            if error: record["error"] = error
+            trace.spans.append(record)
+
+def detach():
+    """
+    Stops the calling task from recording into the trace it inherited. Long-lived
+    workers call this, since asyncio tasks copy the context of whoever created them.
+    """
+    _current_trace.set(None)
+    _current_span.set(None)
+
+def get_traces(limit=50, min_ms=0, trace_id=None):
+    """Finished traces newest first, optionally only those slower than `min_ms`."""
+    found = []
+    for trace in reversed(traces):
+        if trace_id and trace.trace_id != trace_id: continue
+        if (trace.duration_ms or 0) < min_ms: continue
+        found.append(trace.to_dict())
+        if len(found) >= limit: break
+    return found
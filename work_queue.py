@@ -0,0 +1,111 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from config import HANDLER_WORKERS, HANDLER_QUEUE_MAX
+from metrics import QUEUE_WAIT_SECONDS
+from tracing import detach
+
+logger = logging.getLogger(__name__)
+
+# Message classes, most urgent first
+PRIORITY_DIRECT = 0   # Saved Messages and DMs
+PRIORITY_MENTION = 1  # Mentions and replies to me
+PRIORITY_KEYWORD = 2  # Keyword hits in groups
+PRIORITY_NAMES = {PRIORITY_DIRECT: "direct", PRIORITY_MENTION: "mention", PRIORITY_KEYWORD: "keyword"}
+
+WAIT_SAMPLES = 500 # Recent queue waits kept for percentiles
+
+class PriorityWorkQueue:
+    """
+    Bounded priority queue drained by a fixed pool of workers, so slow LLM/Notion
+    calls run with limited concurrency and urgent chats are never stuck behind a
+    flood of keyword hits. Within a class, jobs run in arrival order. When the queue
+    is full the least urgent, newest job is shed (which may be the one being submitted).
+    """
+
+    def __init__(self, workers=HANDLER_WORKERS, max_depth=HANDLER_QUEUE_MAX):
+        self.worker_count = workers
+        self.max_depth = max_depth
+        self._heap = [] # (priority, seq, enqueued_at, func, args)
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._workers = []
+        self._busy = 0
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self.stats_counters = {"enqueued": 0, "processed": 0, "failed": 0, "shed": 0}
+        self.shed_by_class = {name: 0 for name in PRIORITY_NAMES.values()}
+
+    @property
+    def depth(self):
+        return len(self._heap)
+
+    def submit(self, priority, func, *args):
+        """Queues `func(*args)`; returns False if the job was shed because the queue is full."""
+        job = (priority, next(self._seq), time.monotonic(), func, args)
+        if len(self._heap) >= self.max_depth:
+            worst = max(self._heap, key=lambda j: j[:2])
+            if job[:2] > worst[:2]:
+                self._shed(job)
+                return False
+            self._heap.remove(worst)
+            heapq.heapify(self._heap)
+            self._shed(worst)
+
+        heapq.heappush(self._heap, job)
+        self.stats_counters["enqueued"] += 1
+        self._ensure_workers()
+        self._wakeup.set()
+        return True
+
+    def _shed(self, job):
+        self.stats_counters["shed"] += 1
+        self.shed_by_class[PRIORITY_NAMES.get(job[0], str(job[0]))] += 1
+        logger.warning(f"Handler queue full ({self.max_depth}); shedding a {PRIORITY_NAMES.get(job[0], job[0])} job.")
+
+    def _ensure_workers(self):
+        """Starts the workers lazily so they attach to the running loop."""
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def _worker(self):
+        detach() # Each job starts its own trace
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            priority, _, enqueued_at, func, args = heapq.heappop(self._heap)
+            wait = time.monotonic() - enqueued_at
+            self._waits.append(wait)
+            QUEUE_WAIT_SECONDS.observe(wait, priority=PRIORITY_NAMES.get(priority, priority))
+            self._busy += 1
+            try:
+                await func(*args)
+                self.stats_counters["processed"] += 1
+            except Exception as e:
+                self.stats_counters["failed"] += 1
+                logger.error(f"Handler job ({PRIORITY_NAMES.get(priority, priority)}) failed: {e}")
+            finally:
+                self._busy -= 1
+
+    def stats(self):
+        now = time.monotonic()
+        waits = sorted(self._waits)
+        depth_by_class = {name: 0 for name in PRIORITY_NAMES.values()}
+        for job in self._heap:
+            depth_by_class[PRIORITY_NAMES.get(job[0], str(job[0]))] += 1
+        return {
+            "depth": self.depth,
+            "depth_by_class": depth_by_class,
+            "busy_workers": self._busy,
+            "workers": self.worker_count,
+            "oldest_wait_seconds": round(now - min(j[2] for j in self._heap), 3) if self._heap else 0,
+            "wait_p50_seconds": round(waits[len(waits) // 2], 3) if waits else 0,
+            "wait_p95_seconds": round(waits[int(len(waits) * 0.95)], 3) if waits else 0,
+            "shed_by_class": dict(self.shed_by_class),
+            **self.stats_counters
+        }